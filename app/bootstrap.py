@@ -0,0 +1,22 @@
+# app/bootstrap.py
+# -*- coding: utf-8 -*-
+import streamlit as st
+
+from app.persistence.db import init_db
+from app.persistence.models import Base
+from app.persistence.repositories.users_repo import UserRepository
+from app.persistence.repositories.records_repo import RecordRepository
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_repos():
+    """Schéma + repositories créés une seule fois par process."""
+    init_db(Base, drop_and_recreate=False)
+    return UserRepository(), RecordRepository()
+
+
+def repos():
+    """(users, records) : mêmes instances pour toutes les pages, mémorisées dans la session."""
+    if "_repos" not in st.session_state:
+        st.session_state["_repos"] = _shared_repos()
+    return st.session_state["_repos"]
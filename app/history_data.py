@@ -0,0 +1,57 @@
+# app/history_data.py
+# -*- coding: utf-8 -*-
+"""
+Chargements mis en cache (st.cache_data) de la page Historique.
+
+Module importable : main.py invalide uniquement ces fonctions après une écriture
+(clear_history_cache) au lieu de vider tout st.cache_data.
+"""
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from app.bootstrap import repos
+
+
+def _records():
+    return repos()[1]
+
+
+# Chargement des données filtrées (mis en cache : un widget sans effet sur la période ne re-requête pas)
+@st.cache_data(ttl=60, show_spinner=False)
+def load_range(uid: int, start_date: dt.date, end_date: dt.date, asc: bool = True) -> pd.DataFrame:
+    rows_rng = _records().get_range_rows(uid, start=start_date, end=end_date, asc=asc)
+    if not rows_rng:
+        return pd.DataFrame(columns=["date", "humeur", "sommeil_h", "stress", "concentration", "SCJ", "interpretation"])
+    # Construction colonne par colonne (pas de dict par ligne) ; métriques 0..10 en float32
+    n = len(rows_rng)
+    return pd.DataFrame({
+        "date": [r.date for r in rows_rng],
+        "humeur": np.fromiter((r.humeur for r in rows_rng), dtype=np.float32, count=n),
+        "sommeil_h": np.fromiter((r.sommeil for r in rows_rng), dtype=np.float32, count=n),
+        "stress": np.fromiter((r.stress for r in rows_rng), dtype=np.float32, count=n),
+        "concentration": np.fromiter((r.concentration for r in rows_rng), dtype=np.float32, count=n),
+        "SCJ": np.fromiter((r.scj for r in rows_rng), dtype=np.float32, count=n),
+        "interpretation": [r.interpretation for r in rows_rng],
+    }).sort_values("date")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_df_by_range(uid: int, start_date: dt.date, end_date: dt.date) -> pd.DataFrame:
+    # Colonnes NumPy déjà typées (dates datetime64, métriques float32) : pas de to_datetime/normalize
+    return pd.DataFrame(_records().daily_means_arrays(uid, start=start_date, end=end_date))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def export_csv(uid: int, start_date: dt.date, end_date: dt.date, asc: bool = True) -> bytes:
+    return load_range(uid, start_date, end_date, asc).to_csv(index=False).encode("utf-8")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_kpis(uid: int, start_date: dt.date, end_date: dt.date) -> tuple:
+    return _records().range_kpis(uid, start=start_date, end=end_date)
+
+
+def clear_history_cache() -> None:
+    """Invalide les seuls chargements dérivés des records (appelé après un enregistrement)."""
+    for fn in (load_range, fetch_df_by_range, export_csv, load_kpis):
+        fn.clear()
@@ -10,11 +10,10 @@ import datetime as dt
 import pandas as pd
 import streamlit as st
 
-# DB init (assure que les tables existent)
-from app.persistence.db import init_db
-from app.persistence.models import Base
-from app.persistence.repositories.users_repo import UserRepository
-from app.persistence.repositories.records_repo import RecordRepository
+# DB init (assure que les tables existent) + repositories partagés
+from app.bootstrap import repos
+from app.history_data import clear_history_cache
+from app.persistence.db import request_session
 
 # Score engine
 from app.services.score_engine import DailyInput, compute_scj, interpret_scj
@@ -25,88 +24,108 @@ from app.services.ai_service import AIService, DailyInputsLite
 # ---------------------------------------------------------------------
 # Bootstrapping
 # ---------------------------------------------------------------------
-init_db(Base, drop_and_recreate=False)
-users_repo = UserRepository()
-records_repo = RecordRepository()
+users_repo, records_repo = repos()
 
 st.set_page_config(page_title="QuantifyMe", page_icon="🧠", layout="centered")
 
-# ---------------------------------------------------------------------
-# Sidebar – Sélection / création utilisateur
-# ---------------------------------------------------------------------
-st.sidebar.title("👤 Utilisateur")
-default_email = os.getenv("QME_DEFAULT_EMAIL", "demo@example.com")
-email = st.sidebar.text_input("Email", value=default_email, help="Créé s'il n'existe pas")
-make_premium = st.sidebar.checkbox("Premium ?", value=False)
-
-if st.sidebar.button("Charger/Créer l'utilisateur"):
-    u = users_repo.get_or_create(email, is_premium=make_premium)
-    st.session_state["user_id"] = u.id
-    st.session_state["user_email"] = u.email
-    st.sidebar.success(f"OK : {u.email} (id={u.id})")
-
-# état par défaut au premier chargement
-if "user_id" not in st.session_state:
-    u = users_repo.get_or_create(default_email, is_premium=False)
-    st.session_state["user_id"] = u.id
-    st.session_state["user_email"] = u.email
-
-user_id = st.session_state["user_id"]
-user_email = st.session_state["user_email"]
-
-st.caption(f"Connecté en tant que **{user_email}** (id={user_id})")
-
-# ---------------------------------------------------------------------
-# Formulaire de saisie quotidienne
-# ---------------------------------------------------------------------
-st.title("🧠 QuantifyMe — Journal cognitif")
-
-with st.form("daily_form", clear_on_submit=False):
-    col1, col2 = st.columns(2)
-    with col1:
-        date = st.date_input("Date", value=dt.date.today())
-        humeur = st.slider("Humeur", min_value=0.0, max_value=10.0, value=6.5, step=0.1)
-        stress = st.slider("Stress", min_value=0.0, max_value=10.0, value=4.0, step=0.1)
-    with col2:
-        sommeil = st.slider("Sommeil (h)", min_value=0.0, max_value=14.0, value=7.0, step=0.1)
-        concentration = st.slider("Concentration", min_value=0.0, max_value=10.0, value=6.5, step=0.1)
-
-    use_ai = st.checkbox("Générer une interprétation IA", value=True, help="Stub par défaut ; Hugging Face si configuré")
-    submitted = st.form_submit_button("Enregistrer la journée")
-
-if submitted:
-    # Calcul SCJ
-    day = DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
-    res = compute_scj(day)
-
-    # Interprétation : IA si coché, sinon règle simple locale
-    interpretation = None
-    if use_ai:
-        try:
-            svc = AIService()  # Stub si pas de HF_TOKEN
-            interpretation = svc.generate_interpretation(
-                scj=res.scj,
-                inputs=DailyInputsLite(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration),
-            )
-        except Exception as e:
-            interpretation = f"(IA indisponible) {interpret_scj(res.scj)}"
-            st.warning(f"IA non configurée ou erreur : {e}")
-    else:
-        interpretation = interpret_scj(res.scj)
-
-    # Enregistrement (upsert par date)
-    rec = records_repo.upsert(
-        user_id=user_id,
-        date=date,
-        humeur=humeur,
-        sommeil=sommeil,
-        stress=stress,
-        concentration=concentration,
-        scj=float(res.scj),
-        interpretation=interpretation,
-    )
-
-    st.success(f"✅ Enregistré pour {date.isoformat()} — SCJ = {res.scj}")
-    if interpretation:
-        st.info(interpretation)
 
+def render(db_session) -> None:
+    """Corps de la page ; toutes les écritures du rerun passent par `db_session`."""
+    # ---------------------------------------------------------------------
+    # Sidebar – Sélection / création utilisateur
+    # ---------------------------------------------------------------------
+    st.sidebar.title("👤 Utilisateur")
+    default_email = os.getenv("QME_DEFAULT_EMAIL", "demo@example.com")
+    email = st.sidebar.text_input("Email", value=default_email, help="Créé s'il n'existe pas")
+    make_premium = st.sidebar.checkbox("Premium ?", value=False)
+
+    if st.sidebar.button("Charger/Créer l'utilisateur"):
+        u = users_repo.get_or_create(email, is_premium=make_premium, session=db_session)
+        db_session.commit()  # l'id mémorisé dans session_state doit survivre à un rollback ultérieur
+        st.session_state["user_id"] = u.id
+        st.session_state["user_email"] = u.email
+        st.sidebar.success(f"OK : {u.email} (id={u.id})")
+
+    # état par défaut au premier chargement
+    if "user_id" not in st.session_state:
+        u = users_repo.get_or_create(default_email, is_premium=False, session=db_session)
+        db_session.commit()
+        st.session_state["user_id"] = u.id
+        st.session_state["user_email"] = u.email
+
+    user_id = st.session_state["user_id"]
+    user_email = st.session_state["user_email"]
+
+    st.caption(f"Connecté en tant que **{user_email}** (id={user_id})")
+
+    # ---------------------------------------------------------------------
+    # Formulaire de saisie quotidienne
+    # ---------------------------------------------------------------------
+    st.title("🧠 QuantifyMe — Journal cognitif")
+
+    with st.form("daily_form", clear_on_submit=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            date = st.date_input("Date", value=dt.date.today())
+            humeur = st.slider("Humeur", min_value=0.0, max_value=10.0, value=6.5, step=0.1)
+            stress = st.slider("Stress", min_value=0.0, max_value=10.0, value=4.0, step=0.1)
+        with col2:
+            sommeil = st.slider("Sommeil (h)", min_value=0.0, max_value=14.0, value=7.0, step=0.1)
+            concentration = st.slider("Concentration", min_value=0.0, max_value=10.0, value=6.5, step=0.1)
+
+        use_ai = st.checkbox("Générer une interprétation IA", value=True, help="Stub par défaut ; Hugging Face si configuré")
+        submitted = st.form_submit_button("Enregistrer la journée")
+
+    if submitted:
+        # Calcul SCJ
+        day = DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
+        res = compute_scj(day)
+
+        # Interprétation : IA si coché, sinon règle simple locale
+        interpretation = None
+        live = st.empty()
+        if use_ai:
+            try:
+                svc = AIService()  # Stub si pas de HF_TOKEN
+                # Affichage token par token (HF) dans un emplacement temporaire ;
+                # write_stream renvoie le texte complet, réaffiché plus bas via st.info
+                with live.container():
+                    interpretation = st.write_stream(svc.generate_interpretation_stream(
+                        scj=res.scj,
+                        inputs=DailyInputsLite(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration),
+                    ))
+                if not isinstance(interpretation, str):
+                    interpretation = "".join(map(str, interpretation))
+                interpretation = interpretation.strip()
+            except Exception as e:
+                interpretation = f"(IA indisponible) {interpret_scj(res.scj)}"
+                st.warning(f"IA non configurée ou erreur : {e}")
+        else:
+            interpretation = interpret_scj(res.scj)
+
+        # Enregistrement (upsert par date)
+        rec = records_repo.upsert(
+            user_id=user_id,
+            date=date,
+            humeur=humeur,
+            sommeil=sommeil,
+            stress=stress,
+            concentration=concentration,
+            scj=float(res.scj),
+            interpretation=interpretation,
+            session=db_session,
+        )
+        db_session.commit()  # la journée est persistée avant d'être annoncée
+        # Invalide les seules données mises en cache par la page Historique
+        clear_history_cache()
+
+        live.empty()
+        st.success(f"✅ Enregistré pour {date.isoformat()} — SCJ = {res.scj}")
+        if interpretation:
+            st.info(interpretation)
+
+
+# Une seule session/transaction pour tout le rerun : commit en fin de script,
+# rollback si erreur, fermée dans tous les cas (même st.stop()/rerun interrompu)
+with request_session() as db_session:
+    render(db_session)
@@ -9,21 +9,20 @@ if ROOT not in sys.path:
 # -------------------------------------------------------------
 
 import datetime as dt
-import io
 import pandas as pd
 import streamlit as st
-import altair as alt
 
+from app.bootstrap import repos
+from app.history_data import export_csv, fetch_df_by_range, load_kpis
 
-from app.persistence.db import init_db
-from app.persistence.models import Base
-from app.persistence.repositories.users_repo import UserRepository
-from app.persistence.repositories.records_repo import RecordRepository
 
-# Boot DB
-init_db(Base, drop_and_recreate=False)
-users = UserRepository()
-records = RecordRepository()
+def _altair():
+    """Import différé d'Altair : seulement quand un graphique est réellement rendu (ensuite servi par sys.modules)."""
+    import altair as alt
+    return alt
+
+# Repositories partagés (schéma initialisé une fois par process)
+users = repos()[0]
 
 st.set_page_config(page_title="Historique — QuantifyMe", page_icon="📜", layout="wide")
 st.title("📜 Historique")
@@ -48,87 +47,68 @@ start = st.sidebar.date_input("Du", value=default_start)
 end = st.sidebar.date_input("Au", value=today)
 asc = st.sidebar.toggle("Ordre chronologique (ascendant)", value=True)
 
-# Chargement des données filtrées
-rows = records.get_range(user_id, start=start, end=end, asc=asc)
+# KPIs d'abord : une seule requête agrégée, sans charger les lignes
+n_days, scj_avg, scj_max = load_kpis(user_id, start, end)
 
-if not rows:
+if not n_days:
     st.info("Aucune donnée dans cette période.")
 else:
-    df = pd.DataFrame([{
-        "date": r.date,
-        "humeur": r.humeur,
-        "sommeil_h": r.sommeil,
-        "stress": r.stress,
-        "concentration": r.concentration,
-        "SCJ": r.scj,
-        "interpretation": r.interpretation,
-    } for r in rows]).sort_values("date")
-
     # KPIs
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Nb. jours", len(df))
+        st.metric("Nb. jours", n_days)
     with col2:
-        st.metric("SCJ moyen période", f"{df['SCJ'].mean():.2f}")
+        st.metric("SCJ moyen période", f"{scj_avg:.2f}")
     with col3:
-        st.metric("SCJ max", f"{df['SCJ'].max():.2f}")
-
-# Agrégation par jour pour un affichage clair
-df_day = df.copy()
-df_day["day"] = pd.to_datetime(df_day["date"])  # s'assure du type datetime
-df_day["day"] = df_day["day"].dt.normalize()    # force 00:00:00 (pas obligatoire mais propre)
-
-# Si jamais plusieurs enregistrements le même jour → on moyenne
-df_day_agg = (
-    df_day.groupby("day", as_index=False)[["SCJ", "humeur", "stress", "concentration"]]
-        .mean()
-        .sort_values("day")
-)
+        st.metric("SCJ max", f"{scj_max:.2f}")
+
+    alt = _altair()
 
-# Chart SCJ (par jour) — on fige l'unité de temps à "date" (sans heures)
-scj_chart = (
-    alt.Chart(df_day_agg)
-    .mark_line(point=True)
-    .encode(
-        x=alt.X("yearmonthdate(day):T",
-                title="Jour",
-                axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
-        y=alt.Y("SCJ:Q", title="SCJ"),
-        tooltip=[alt.Tooltip("day:T", title="Jour", format="%Y-%m-%d"),
-                 alt.Tooltip("SCJ:Q", format=".2f")]
+    # Agrégation par jour (GROUP BY côté SQLite) pour un affichage clair
+    df_day_agg = fetch_df_by_range(user_id, start, end)
+
+    # Chart SCJ (par jour) — on fige l'unité de temps à "date" (sans heures)
+    scj_chart = (
+        alt.Chart(df_day_agg[["day", "SCJ"]])  # seules les colonnes encodées sont sérialisées
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("yearmonthdate(day):T",
+                    title="Jour",
+                    axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
+            y=alt.Y("SCJ:Q", title="SCJ"),
+            tooltip=[alt.Tooltip("day:T", title="Jour", format="%Y-%m-%d"),
+                     alt.Tooltip("SCJ:Q", format=".2f")]
+        )
+        .properties(height=280)
     )
-    .properties(height=280)
-)
 
-st.subheader("Évolution du SCJ (par jour)")
-st.altair_chart(scj_chart, use_container_width=True)
-
-# Chart Humeur/Stress/Concentration (par jour)
-hsc_long = df_day_agg.melt(id_vars="day", value_vars=["humeur", "stress", "concentration"],
-                            var_name="métrique", value_name="valeur")
-
-hsc_chart = (
-    alt.Chart(hsc_long)
-    .mark_bar()
-    .encode(
-        x=alt.X("yearmonthdate(day):T",
-                title="Jour",
-                axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
-        y=alt.Y("valeur:Q", title="Valeur moyenne"),
-        color=alt.Color("métrique:N", title=""),
-        tooltip=[alt.Tooltip("day:T", title="Jour", format="%Y-%m-%d"),
-                 "métrique:N", alt.Tooltip("valeur:Q", format=".2f")]
+    st.subheader("Évolution du SCJ (par jour)")
+    st.altair_chart(scj_chart, use_container_width=True)
+
+    # Chart Humeur/Stress/Concentration (par jour)
+    # Le passage au format long se fait côté Vega (transform_fold) : pas de melt pandas ni de payload ×3
+    hsc_chart = (
+        alt.Chart(df_day_agg[["day", "humeur", "stress", "concentration"]])
+        .transform_fold(["humeur", "stress", "concentration"], as_=["métrique", "valeur"])
+        .mark_bar()
+        .encode(
+            x=alt.X("yearmonthdate(day):T",
+                    title="Jour",
+                    axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
+            y=alt.Y("valeur:Q", title="Valeur moyenne"),
+            color=alt.Color("métrique:N", title=""),
+            tooltip=[alt.Tooltip("day:T", title="Jour", format="%Y-%m-%d"),
+                     "métrique:N", alt.Tooltip("valeur:Q", format=".2f")]
+        )
+        .properties(height=280)
     )
-    .properties(height=280)
-)
 
-st.subheader("Humeur / Stress / Concentration (par jour)")
-st.altair_chart(hsc_chart, use_container_width=True)
+    st.subheader("Humeur / Stress / Concentration (par jour)")
+    st.altair_chart(hsc_chart, use_container_width=True)
 
-# Export CSV
-csv_buf = io.StringIO()
-df.to_csv(csv_buf, index=False)
-st.download_button("⬇️ Export CSV", data=csv_buf.getvalue(), file_name="historique_quantifyme.csv", mime="text/csv")
+    # Export CSV (seule section qui a besoin des lignes complètes), sérialisé une fois par période
+    st.download_button("⬇️ Export CSV", data=export_csv(user_id, start, end, asc),
+                       file_name="historique_quantifyme.csv", mime="text/csv")
 
 # =========================
 # 🔀 Comparaison de périodes
@@ -141,23 +121,6 @@ preset = st.radio(
     horizontal=True,
 )
 
-def fetch_df_by_range(uid: int, start_date: dt.date, end_date: dt.date) -> pd.DataFrame:
-    rows_rng = records.get_range(uid, start=start_date, end=end_date, asc=True)
-    if not rows_rng:
-        return pd.DataFrame(columns=["day", "SCJ", "humeur", "stress", "concentration"])
-    df_rng = pd.DataFrame([{
-        "date": r.date,
-        "SCJ": r.scj,
-        "humeur": r.humeur,
-        "stress": r.stress,
-        "concentration": r.concentration,
-    } for r in rows_rng]).sort_values("date")
-    df_rng["day"] = pd.to_datetime(df_rng["date"]).dt.normalize()
-    # agrégation par jour
-    return (df_rng.groupby("day", as_index=False)[["SCJ", "humeur", "stress", "concentration"]]
-                    .mean()
-                    .sort_values("day"))
-
 today = dt.date.today()
 
 if preset == "7 derniers vs précédents":
@@ -182,15 +145,26 @@ else:
         st.warning("Vérifie les bornes : la date de début doit être ≤ à la date de fin.")
         st.stop()
 
-df_A = fetch_df_by_range(user_id, start_A, end_A)
-df_B = fetch_df_by_range(user_id, start_B, end_B)
+def fetch_two_ranges(uid: int, start_a: dt.date, end_a: dt.date,
+                     start_b: dt.date, end_b: dt.date) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Une seule requête sur la fenêtre englobante, puis découpage par masques (sauf périodes très éloignées)."""
+    gap = max(start_a, start_b) - min(end_a, end_b)
+    if gap > dt.timedelta(days=30):
+        return fetch_df_by_range(uid, start_a, end_a), fetch_df_by_range(uid, start_b, end_b)
+    df_all = fetch_df_by_range(uid, min(start_a, start_b), max(end_a, end_b))
+    day = df_all["day"]
+    in_a = (day >= pd.Timestamp(start_a)) & (day <= pd.Timestamp(end_a))
+    in_b = (day >= pd.Timestamp(start_b)) & (day <= pd.Timestamp(end_b))
+    return df_all[in_a], df_all[in_b]
+
+df_A, df_B = fetch_two_ranges(user_id, start_A, end_A, start_B, end_B)
 
 if df_A.empty or df_B.empty:
     st.info("Données insuffisantes pour l’une des périodes sélectionnées.")
 else:
     # Aligner sur un axe 'Jour 1..N' pour comparaison
-    df_A = df_A.reset_index(drop=True).copy()
-    df_B = df_B.reset_index(drop=True).copy()
+    df_A = df_A.reset_index(drop=True)
+    df_B = df_B.reset_index(drop=True)
     df_A["rank_day"] = df_A.index + 1
     df_B["rank_day"] = df_B.index + 1
     df_A["période"] = f"A ({start_A} → {end_A})"
@@ -201,6 +175,7 @@ else:
                         df_B[["rank_day", "SCJ", "période"]]], ignore_index=True)
 
     st.subheader("SCJ moyen — comparaison alignée (Jour 1…N)")
+    alt = _altair()
     chart = (
         alt.Chart(df_cmp)
         .mark_line(point=True)
@@ -8,16 +8,14 @@ if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 # ------------------------------------------------
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from app.persistence.db import init_db
-from app.persistence.models import Base
-from app.persistence.repositories.users_repo import UserRepository
+from app.bootstrap import repos
 
-# DB ready
-init_db(Base, drop_and_recreate=False)
-users = UserRepository()
+# Repositories partagés (schéma initialisé une fois par process)
+users, _ = repos()
 
 st.set_page_config(page_title="Inscription / Premium — QuantifyMe", page_icon="⭐", layout="centered")
 st.title("⭐ Devenir Premium")
@@ -53,9 +51,12 @@ features = [
     ("Export CSV / future API d’export", False, True),
     ("Support prioritaire", False, True),
 ]
-df = pd.DataFrame(features, columns=["Fonctionnalité", "Gratuit", "Premium"])
-df["Gratuit"] = df["Gratuit"].map(lambda x: "✅" if x else "—")
-df["Premium"] = df["Premium"].map(lambda x: "✅" if x else "—")
+names, free_flags, prem_flags = zip(*features)
+df = pd.DataFrame({
+    "Fonctionnalité": names,
+    "Gratuit": np.where(free_flags, "✅", "—"),
+    "Premium": np.where(prem_flags, "✅", "—"),
+})
 
 st.subheader("📦 Avantages")
 st.table(df)
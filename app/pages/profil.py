@@ -12,15 +12,10 @@ import datetime as dt
 import pandas as pd
 import streamlit as st
 
-from app.persistence.db import init_db
-from app.persistence.models import Base
-from app.persistence.repositories.users_repo import UserRepository
-from app.persistence.repositories.records_repo import RecordRepository
-
-# Boot DB (no drop)
-init_db(Base, drop_and_recreate=False)
-users = UserRepository()
-records = RecordRepository()
+from app.bootstrap import repos
+
+# Repositories partagés (schéma initialisé une fois par process)
+users, records = repos()
 
 st.set_page_config(page_title="Profil — QuantifyMe", page_icon="👤", layout="centered")
 st.title("👤 Profil")
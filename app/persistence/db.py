@@ -1,37 +1,117 @@
 # app/persistence/db.py
 # -*- coding: utf-8 -*-
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from contextlib import contextmanager
+from functools import lru_cache
 import os
 
 DB_URL = os.getenv("DB_URL", "sqlite:///quantifyme.db")
 
-engine = create_engine(DB_URL, echo=False, future=True)
 
-SessionLocal = sessionmaker(
-    bind=engine,
-    autoflush=False,
-    autocommit=False,
-    expire_on_commit=False,  # important pour éviter DetachedInstanceError
-    future=True,
-)
+def _sqlite_pragmas(dbapi_conn, _record):
+    """
+    WAL + synchronous=NORMAL : moins de fsync par écriture, lecteurs non bloqués pendant un commit.
+    Cache de pages ~20 Mo par connexion (cache_size négatif = en Kio).
+    """
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-20000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+
+def make_engine(url: str):
+    """Construit un engine pour `url` (PRAGMAs de performance appliqués si SQLite)."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, future=True)
+    kwargs = {}
+    if ":memory:" in url or url in ("sqlite://", "sqlite+pysqlite://"):
+        # Base en mémoire : une seule connexion partagée, sinon chaque connexion verrait une base vide
+        kwargs["poolclass"] = StaticPool
+    # Streamlit exécute les reruns sur plusieurs threads : connexions partageables (QueuePool)
+    eng = create_engine(url, echo=False, future=True, connect_args={"check_same_thread": False}, **kwargs)
+    event.listen(eng, "connect", _sqlite_pragmas)
+    return eng
+
+
+def make_session(engine):
+    """Fabrique de sessions liée à `engine`."""
+    return sessionmaker(
+        bind=engine,
+        autoflush=False,
+        autocommit=False,
+        expire_on_commit=False,  # important pour éviter DetachedInstanceError
+        future=True,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Engine unique par process (partagé entre reruns Streamlit)."""
+    return make_engine(DB_URL)
+
+
+@lru_cache(maxsize=1)
+def get_session_factory():
+    """Fabrique de sessions construite sur l'engine en cache."""
+    return make_session(get_engine())
+
+
+engine = get_engine()
+SessionLocal = get_session_factory()
 
 @contextmanager
-def get_session():
-    """Contexte gérant automatiquement commit/rollback."""
-    s = SessionLocal()
+def get_session(session_factory=None):
+    """Contexte gérant automatiquement commit/rollback/close (SessionLocal par défaut)."""
+    with (session_factory or SessionLocal).begin() as s:
+        yield s
+
+@contextmanager
+def session_scope(session=None, session_factory=None):
+    """
+    Réutilise `session` si elle est fournie (commit à la charge de l'appelant),
+    sinon ouvre une session courte via get_session(session_factory).
+    """
+    if session is not None:
+        yield session
+        return
+    with get_session(session_factory) as s:
+        yield s
+
+@contextmanager
+def request_session(session_factory=None):
+    """
+    Session unique pour un rerun Streamlit (une seule transaction), toujours fermée en sortie :
+    - commit si le script va au bout, ou s'il est arrêté par st.stop()/un rerun
+      (exceptions de contrôle Streamlit, hors Exception : le travail déjà fait est cohérent) ;
+    - rollback sur erreur, pour ne laisser ni transaction d'écriture ouverte ni session en échec.
+    """
+    s = (session_factory or SessionLocal)()
     try:
         yield s
-        s.commit()
-    except Exception:
+    except (Exception, KeyboardInterrupt):
         s.rollback()
         raise
+    except BaseException:
+        s.commit()
+        raise
+    else:
+        s.commit()
     finally:
         s.close()
 
+_schema_ready = False
+
 def init_db(Base, drop_and_recreate=False):
-    """Crée les tables (et les recrée si demandé)."""
+    """Crée les tables (et les recrée si demandé). Sans drop, n'agit qu'une fois par process."""
+    global _schema_ready
+    if _schema_ready and not drop_and_recreate:
+        return
     if drop_and_recreate:
         Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
+    _schema_ready = True
@@ -1,7 +1,7 @@
 # app/persistence/models.py
 # -*- coding: utf-8 -*-
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, Date, DateTime, Boolean, ForeignKey, UniqueConstraint, func
+from sqlalchemy import Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint, func
 import datetime as dt
 
 class Base(DeclarativeBase):
@@ -22,7 +22,8 @@ class Record(Base):
     __table_args__ = (UniqueConstraint("user_id", "date", name="uq_user_day"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
+    # Pas d'index dédié sur user_id : c'est le préfixe de ix_records_user_date_desc (et de uq_user_day)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     date: Mapped[dt.date] = mapped_column(Date, index=True, nullable=False)
 
     humeur: Mapped[float] = mapped_column(Float, nullable=False)
@@ -35,3 +36,6 @@ class Record(Base):
     created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="records")
+
+# Index composite (user_id, date DESC) : get_range / weekly_avg / last_n en range scan, sans étape de tri
+Index("ix_records_user_date_desc", Record.user_id, Record.date.desc())
@@ -1,84 +1,252 @@
 # app/persistence/repositories/records_repo.py
 # -*- coding: utf-8 -*-
-from sqlalchemy import select, func, and_
-from app.persistence.db import get_session
-from app.persistence.models import Record
+from sqlalchemy import insert, select, func, and_, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+from app.persistence.db import session_scope
+from app.persistence.models import Record, User
 import datetime as dt
+import functools
+from array import array
+from statistics import fmean
 
-def _normalize_date(d):
-    if isinstance(d, dt.datetime):
-        return d.date()
-    if isinstance(d, dt.date):
-        return d
-    if isinstance(d, str):
-        return dt.date.fromisoformat(d)
+import numpy as np
+
+@functools.singledispatch
+def _to_date(d):
+    """Normalise date / datetime / str ISO en datetime.date (dispatch sur le type, sans chaîne d'isinstance)."""
     raise TypeError("Invalid date type")
 
+
+@_to_date.register
+def _(d: dt.date):
+    return d
+
+
+@_to_date.register
+def _(d: dt.datetime):
+    return d.date()
+
+
+# Les mêmes chaînes ISO reviennent souvent (aujourd'hui, bornes de période) : parsing mémoïsé
+_parse_iso = functools.lru_cache(maxsize=1024)(dt.date.fromisoformat)
+
+
+@_to_date.register
+def _(d: str):
+    return _parse_iso(d)
+
+
+# Moteurs disposant d'un INSERT ... ON CONFLICT(...) DO UPDATE ; les autres passent par SELECT puis INSERT/UPDATE
+_ON_CONFLICT_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _merge_row(s, user_id: int, day: dt.date, fields: dict) -> Record:
+    """Upsert portable d'une ligne (SELECT puis INSERT ou UPDATE) dans la session `s`."""
+    rec = s.scalar(select(Record).where(and_(Record.user_id == user_id, Record.date == day)).limit(1))
+    if rec is None:
+        rec = Record(user_id=user_id, date=day)
+        s.add(rec)
+    for k, v in fields.items():
+        setattr(rec, k, v)
+    return rec
+
 class RecordRepository:
-    def add(self, user_id: int, date, **fields) -> Record:
-        day = _normalize_date(date)
-        with get_session() as s:
-            exists = s.scalar(select(Record.id).where(and_(Record.user_id == user_id, Record.date == day)))
-            if exists:
+    def __init__(self, session_factory=None):
+        # sessionmaker dédié (ex. base de test) ; None => SessionLocal du process
+        self._sessions = session_factory
+
+    def add(self, user_id: int, date, session=None, **fields) -> Record:
+        day = _to_date(date)
+        with session_scope(session, self._sessions) as s:
+            if self._exists(s, user_id, day):
                 raise ValueError(f"Record déjà présent pour {day}")
             r = Record(user_id=user_id, date=day, **fields)
             s.add(r); s.flush(); s.refresh(r); s.expunge(r)
             return r
 
-    def upsert(self, user_id: int, date, **fields) -> Record:
-        day = _normalize_date(date)
-        with get_session() as s:
-            rec = s.scalar(select(Record).where(and_(Record.user_id == user_id, Record.date == day)).limit(1))
-            if rec:
-                for k, v in fields.items():
-                    setattr(rec, k, v)
-                s.add(rec); s.flush(); s.refresh(rec); s.expunge(rec)
-                return rec
-            r = Record(user_id=user_id, date=day, **fields)
-            s.add(r); s.flush(); s.refresh(r); s.expunge(r)
-            return r
+    def add_many(self, user_id: int, rows, session=None) -> int:
+        """
+        Insertion en lot pour un utilisateur : `rows` est un itérable de dicts (date + champs du Record).
+        Un seul INSERT multi-lignes (insertmanyvalues) dans une seule transaction ;
+        un doublon (user_id, date) lève IntegrityError et annule tout le lot.
+        """
+        mappings = [{**r, "user_id": user_id, "date": _to_date(r["date"])} for r in rows]
+        if not mappings:
+            return 0
+        with session_scope(session, self._sessions) as s:
+            s.execute(insert(Record), mappings)
+        return len(mappings)
+
+    def upsert(self, user_id: int, date, session=None, **fields) -> Record:
+        """
+        Insert ou mise à jour atomique du jour : sur SQLite/PostgreSQL, un seul INSERT ... ON CONFLICT(user_id, date)
+        DO UPDATE ... RETURNING (pas de SELECT préalable, l'id de la ligne est conservé).
+        Autres moteurs, ou aucun champ à mettre à jour : SELECT puis INSERT ou UPDATE.
+        """
+        day = _to_date(date)
+        with session_scope(session, self._sessions) as s:
+            dialect_insert = _ON_CONFLICT_INSERT.get(s.get_bind().dialect.name)
+            if dialect_insert is None or not fields:
+                rec = _merge_row(s, user_id, day, fields)
+                s.flush(); s.refresh(rec)
+            else:
+                stmt = dialect_insert(Record).values(user_id=user_id, date=day, **fields)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Record.user_id, Record.date],
+                    set_={k: stmt.excluded[k] for k in fields},
+                ).returning(Record)
+                rec = s.scalars(stmt, execution_options={"populate_existing": True}).one()
+            s.expunge(rec)
+            return rec
 
-    def get_range(self, user_id: int, start=None, end=None, asc=True):
-        with get_session() as s:
+    def upsert_many(self, rows, session=None) -> int:
+        """
+        Upsert en lot : `rows` est une liste de dicts (user_id, date, + champs du Record),
+        tous avec les mêmes clés. Sur SQLite/PostgreSQL, une seule instruction exécutée en executemany ;
+        autres moteurs ou aucun champ à mettre à jour : upsert ligne à ligne dans la même transaction.
+        """
+        rows = [{**r, "date": _to_date(r["date"])} for r in rows]
+        if not rows:
+            return 0
+        updated = [k for k in rows[0] if k not in ("user_id", "date")]
+        with session_scope(session, self._sessions) as s:
+            dialect_insert = _ON_CONFLICT_INSERT.get(s.get_bind().dialect.name)
+            if dialect_insert is None or not updated:
+                for r in rows:
+                    _merge_row(s, r["user_id"], r["date"], {k: r[k] for k in updated})
+                s.flush()
+                return len(rows)
+            stmt = dialect_insert(Record.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Record.user_id, Record.date],
+                set_={k: stmt.excluded[k] for k in updated},
+            )
+            s.execute(stmt, rows)
+        return len(rows)
+
+    def get_range(self, user_id: int, start=None, end=None, asc=True, session=None, with_user=False):
+        """
+        Records de la période. Par défaut, la relation `user` n'est pas chargée (ne pas y accéder
+        sur les objets renvoyés). `with_user=True` la charge en une requête groupée (selectin) :
+        2 requêtes au total au lieu de 1 + N.
+        """
+        with session_scope(session, self._sessions) as s:
             stmt = select(Record).where(Record.user_id == user_id)
+            if with_user:
+                # lazyload(User.records) : ne pas recharger en cascade les records de l'utilisateur
+                stmt = stmt.options(selectinload(Record.user).lazyload(User.records))
             if start is not None:
-                stmt = stmt.where(Record.date >= _normalize_date(start))
+                stmt = stmt.where(Record.date >= _to_date(start))
             if end is not None:
-                stmt = stmt.where(Record.date <= _normalize_date(end))
+                stmt = stmt.where(Record.date <= _to_date(end))
             stmt = stmt.order_by(Record.date.asc() if asc else Record.date.desc())
             rows = list(s.scalars(stmt))
             for r in rows:
                 s.expunge(r)
             return rows
 
-    def last_n(self, user_id: int, n: int = 7):
-        with get_session() as s:
+    def get_range_rows(self, user_id: int, start=None, end=None, asc=True, session=None):
+        """Comme get_range, mais renvoie des tuples légers (sans hydratation ORM)."""
+        with session_scope(session, self._sessions) as s:
+            stmt = select(
+                Record.date, Record.humeur, Record.sommeil, Record.stress,
+                Record.concentration, Record.scj, Record.interpretation,
+            ).where(Record.user_id == user_id)
+            if start is not None:
+                stmt = stmt.where(Record.date >= _to_date(start))
+            if end is not None:
+                stmt = stmt.where(Record.date <= _to_date(end))
+            stmt = stmt.order_by(Record.date.asc() if asc else Record.date.desc())
+            return s.execute(stmt).all()
+
+    def daily_means(self, user_id: int, start=None, end=None, session=None):
+        """Moyennes par jour calculées côté SQL : [(date, scj, humeur, stress, concentration), ...]."""
+        with session_scope(session, self._sessions) as s:
+            stmt = select(
+                Record.date, func.avg(Record.scj), func.avg(Record.humeur),
+                func.avg(Record.stress), func.avg(Record.concentration),
+            ).where(Record.user_id == user_id)
+            if start is not None:
+                stmt = stmt.where(Record.date >= _to_date(start))
+            if end is not None:
+                stmt = stmt.where(Record.date <= _to_date(end))
+            stmt = stmt.group_by(Record.date).order_by(Record.date.asc())
+            return [tuple(r) for r in s.execute(stmt)]
+
+    def daily_means_arrays(self, user_id: int, start=None, end=None, session=None) -> dict:
+        """daily_means au format colonnes NumPy : day en datetime64[D], métriques en float32."""
+        rows = self.daily_means(user_id, start=start, end=end, session=session)
+        n = len(rows)
+        cols = {"day": np.fromiter((r[0] for r in rows), dtype="datetime64[D]", count=n)}
+        for i, name in enumerate(("SCJ", "humeur", "stress", "concentration"), start=1):
+            cols[name] = np.fromiter((r[i] for r in rows), dtype=np.float32, count=n)
+        return cols
+
+    def range_kpis(self, user_id: int, start=None, end=None, session=None):
+        """(nb de jours, SCJ moyen, SCJ max) sur la période, en une seule requête agrégée."""
+        with session_scope(session, self._sessions) as s:
+            stmt = select(func.count(Record.id), func.avg(Record.scj), func.max(Record.scj)).where(
+                Record.user_id == user_id
+            )
+            if start is not None:
+                stmt = stmt.where(Record.date >= _to_date(start))
+            if end is not None:
+                stmt = stmt.where(Record.date <= _to_date(end))
+            count, avg, best = s.execute(stmt).one()
+            return (
+                int(count),
+                float(avg) if avg is not None else None,
+                float(best) if best is not None else None,
+            )
+
+    def existing_dates_with_interpretation(self, user_id: int, session=None) -> set:
+        """Jours de l'utilisateur ayant déjà une interprétation (non vide)."""
+        with session_scope(session, self._sessions) as s:
+            stmt = select(Record.date).where(
+                Record.user_id == user_id,
+                Record.interpretation.is_not(None),
+                Record.interpretation != "",
+            )
+            return set(s.scalars(stmt))
+
+    def last_n(self, user_id: int, n: int = 7, session=None):
+        with session_scope(session, self._sessions) as s:
             stmt = select(Record).where(Record.user_id == user_id).order_by(Record.date.desc()).limit(n)
             rows = list(s.scalars(stmt))
             for r in rows:
                 s.expunge(r)
             return list(reversed(rows))
 
-    def delete(self, user_id: int, date) -> bool:
-        day = _normalize_date(date)
-        with get_session() as s:
+    def delete(self, user_id: int, date, session=None) -> bool:
+        day = _to_date(date)
+        with session_scope(session, self._sessions) as s:
             rec = s.scalar(select(Record).where(and_(Record.user_id == user_id, Record.date == day)).limit(1))
             if not rec:
                 return False
-            s.delete(rec)
+            s.delete(rec); s.flush()
             return True
 
-    def exists(self, user_id: int, date) -> bool:
-        day = _normalize_date(date)
-        with get_session() as s:
-            c = s.scalar(select(func.count(Record.id)).where(and_(Record.user_id == user_id, Record.date == day))) or 0
-            return c > 0
+    def exists(self, user_id: int, date, session=None) -> bool:
+        day = _to_date(date)
+        with session_scope(session, self._sessions) as s:
+            return self._exists(s, user_id, day)
+
+    @staticmethod
+    def _exists(s, user_id: int, day: dt.date) -> bool:
+        # SELECT 1 ... LIMIT 1 : SQLite s'arrête à la première ligne, pas d'agrégat COUNT
+        stmt = select(literal(1)).where(and_(Record.user_id == user_id, Record.date == day)).limit(1)
+        return s.scalar(stmt) is not None
 
-    def weekly_avg(self, user_id: int, end_date=None):
-        end = _normalize_date(end_date) if end_date else dt.date.today()
+    def weekly_avg(self, user_id: int, end_date=None, session=None):
+        end = _to_date(end_date) if end_date else dt.date.today()
         start = end - dt.timedelta(days=6)
-        with get_session() as s:
-            avg = s.scalar(select(func.avg(Record.scj)).where(
-                and_(Record.user_id == user_id, Record.date >= start, Record.date <= end)
-            ))
-            return float(avg) if avg is not None else None
+        window = (Record.user_id == user_id, Record.date.between(start, end))
+        with session_scope(session, self._sessions) as s:
+            if s.get_bind().dialect.name == "sqlite":
+                # Agrégat côté SQLite : une seule valeur remonte, aucun Record hydraté
+                avg = s.scalar(select(func.avg(Record.scj)).where(*window))
+                return float(avg) if avg is not None else None
+            # Repli (autres moteurs) : ≤ 7 scalaires en tableau de doubles contigu + fmean (C)
+            scj = array("d", s.scalars(select(Record.scj).where(*window)))
+            return fmean(scj) if scj else None
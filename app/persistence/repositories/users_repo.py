@@ -1,33 +1,54 @@
 # app/persistence/repositories/users_repo.py
 # -*- coding: utf-8 -*-
+import threading
+
+from cachetools import TTLCache
 from sqlalchemy import select
-from app.persistence.db import get_session
+from app.persistence.db import session_scope
 from app.persistence.models import User
 
 class UserRepository:
-    def create(self, email: str, is_premium: bool = False) -> User:
-        with get_session() as s:
+    def __init__(self, session_factory=None, email_cache_ttl: float = 60):
+        # sessionmaker dédié (ex. base de test) ; None => SessionLocal du process
+        self._sessions = session_factory
+        # Cache court email -> id (la recherche par email de chaque rerun Streamlit devient un get par clé
+        # primaire). L'id d'un email ne change jamais : rien à invalider lors d'une mise à jour.
+        # Instance partagée entre threads (st.cache_resource) : TTLCache n'est pas thread-safe => verrou.
+        self._email_ids = TTLCache(maxsize=1024, ttl=email_cache_ttl)
+        self._email_ids_lock = threading.Lock()
+
+    def create(self, email: str, is_premium: bool = False, session=None) -> User:
+        with session_scope(session, self._sessions) as s:
             u = User(email=email.strip().lower(), is_premium=is_premium)
             s.add(u)
             s.flush(); s.refresh(u); s.expunge(u)
             return u
 
-    def get_by_email(self, email: str) -> User | None:
-        with get_session() as s:
-            u = s.scalar(select(User).where(User.email == email.strip().lower()))
+    def get_by_email(self, email: str, session=None) -> User | None:
+        key = email.strip().lower()
+        with self._email_ids_lock:
+            user_id = self._email_ids.get(key)
+        with session_scope(session, self._sessions) as s:
+            u = s.get(User, user_id) if user_id is not None else None
+            if u is None:
+                u = s.scalar(select(User).where(User.email == key))
             if not u:
                 return None
             s.expunge(u)
-            return u
+        # Seuls les ids lus hors session partagée sont mis en cache (données déjà commitées)
+        if session is None:
+            with self._email_ids_lock:
+                self._email_ids[key] = u.id
+        return u
 
-    def get_or_create(self, email: str, is_premium: bool = False) -> User:
-        u = self.get_by_email(email)
-        return u or self.create(email=email, is_premium=is_premium)
+    def get_or_create(self, email: str, is_premium: bool = False, session=None) -> User:
+        u = self.get_by_email(email, session=session)
+        return u or self.create(email=email, is_premium=is_premium, session=session)
 
-    def set_premium(self, email: str, value: bool = True) -> None:
-        with get_session() as s:
+    def set_premium(self, email: str, value: bool = True, session=None) -> None:
+        with session_scope(session, self._sessions) as s:
             u = s.scalar(select(User).where(User.email == email.strip().lower()))
             if not u:
                 raise ValueError(f"Utilisateur introuvable: {email}")
             u.is_premium = value
-            s.add(u)
+            s.add(u); s.flush()
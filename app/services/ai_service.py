@@ -3,7 +3,7 @@
 """
 Service d'interprétation IA pour QuantifyMe.
 
-Deux providers :
+Providers :
 - StubProvider : offline, déterministe, idéal pour tests/MVP.
 - HuggingFaceProvider : utilise l'Inference API (si HF_TOKEN présent).
 
@@ -21,24 +21,64 @@ Usage:
 
 from __future__ import annotations
 
+import asyncio
+import atexit
+import bisect
+import functools
+import importlib.util
 import os
+import random
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, List, Optional, Protocol, Sequence, Tuple
 
-import json
-import math
+# httpx n'est importé qu'à la première instanciation d'un provider HF (cf. _require_httpx) :
+# un usage stub-only (tests, seed) n'en paie pas le coût au chargement du module.
+httpx = None  # type: ignore
 
+
+# Décodage/encodage JSON des réponses HF : orjson (C, bien plus rapide) si installé, sinon stdlib.
+# Import résolu une fois au chargement du module, pas à chaque réponse.
 try:
-    # httpx est plus robuste pour les timeouts ; installe-le si tu actives HF
-    import httpx  # type: ignore
-except Exception:  # pragma: no cover - httpx optionnel si stub only
-    httpx = None  # type: ignore
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(data) -> str:
+        return orjson.dumps(data).decode()
+except ImportError:
+    import json
+
+    _json_loads = json.loads
+
+    def _json_dumps(data) -> str:
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _require_httpx():
+    global httpx
+    if httpx is None:
+        try:
+            import httpx as _httpx  # type: ignore
+        except Exception:
+            raise RuntimeError("httpx n'est pas installé. `pip install httpx` pour utiliser HuggingFaceProvider.")
+        httpx = _httpx
+    return httpx
 
 
 # -----------------------------------------------------------------------------
 # Modèle d'entrée (réutilisable depuis score_engine)
 # -----------------------------------------------------------------------------
 
+class _HasInputs(Protocol):
+    """Type structurel : tout objet exposant ces 4 mesures (DailyInputsLite, score_engine.DailyInput…)."""
+    humeur: float
+    sommeil: float
+    stress: float
+    concentration: float
+
+
 @dataclass(frozen=True)
 class DailyInputsLite:
     """
@@ -55,26 +95,26 @@ class DailyInputsLite:
 # Provider: Stub (déterministe, offline)
 # -----------------------------------------------------------------------------
 
+# Tranches de SCJ : bisect_right(_THRESHOLDS, scj) donne l'index du message (borne basse incluse)
+_THRESHOLDS = (4.0, 5.5, 7.0, 8.5)
+_MESSAGES = (
+    "Fatigue cognitive marquée. Priorise récupération et sommeil.",
+    "Baisse de régime. Favorise les tâches simples aujourd'hui.",
+    "État correct. Garde des pauses régulières pour rester stable.",
+    "Bonne clarté d'esprit. Programme 1–2 blocs de deep work.",
+    "Énergie mentale très élevée. Vise tes tâches les plus complexes.",
+)
+
+
 class StubProvider:
     """
     Génère un texte court en fonction de SCJ et des entrées, sans aucun appel réseau.
     Déterministe -> parfait pour tests/unit et usage local.
     """
 
-    def generate(self, *, scj: float, inputs: DailyInputsLite | None = None) -> str:
-        parts = []
-
-        # Tranche principale sur le score
-        if scj >= 8.5:
-            parts.append("Énergie mentale très élevée. Vise tes tâches les plus complexes.")
-        elif scj >= 7.0:
-            parts.append("Bonne clarté d'esprit. Programme 1–2 blocs de deep work.")
-        elif scj >= 5.5:
-            parts.append("État correct. Garde des pauses régulières pour rester stable.")
-        elif scj >= 4.0:
-            parts.append("Baisse de régime. Favorise les tâches simples aujourd'hui.")
-        else:
-            parts.append("Fatigue cognitive marquée. Priorise récupération et sommeil.")
+    def generate(self, *, scj: float, inputs: _HasInputs | None = None) -> str:
+        # Tranche principale sur le score (table de seuils, cf. _THRESHOLDS)
+        parts = [_MESSAGES[bisect.bisect_right(_THRESHOLDS, scj)]]
 
         # Affinage rapide si inputs fournis
         if inputs is not None:
@@ -92,6 +132,56 @@ class StubProvider:
 # Provider: Hugging Face Inference API
 # -----------------------------------------------------------------------------
 
+@dataclass(frozen=True)
+class _HFConfig:
+    token: str
+    model: str
+    api_url: str
+    max_tokens: int
+    temperature: float
+    top_p: float
+    timeout_sec: float
+
+
+@functools.lru_cache(maxsize=1)
+def _load_hf_config() -> _HFConfig:
+    """Lit les variables HF_* une seule fois par process (`cache_clear()` pour relire)."""
+    model = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2").strip()
+    return _HFConfig(
+        token=os.getenv("HF_TOKEN", "").strip(),
+        model=model,
+        api_url=os.getenv("HF_API_URL", f"https://api-inference.huggingface.co/models/{model}").strip(),
+        max_tokens=int(os.getenv("HF_MAX_TOKENS", "200")),
+        temperature=float(os.getenv("HF_TEMPERATURE", "0.3")),
+        top_p=float(os.getenv("HF_TOP_P", "0.9")),
+        timeout_sec=float(os.getenv("HF_TIMEOUT_SEC", "12")),
+    )
+
+
+# HTTP/2 (multiplexage sur une connexion) et brotli : activés seulement si `h2` / `brotli`
+# sont installés, sinon httpx refuserait http2=True ou ne saurait pas décoder `br`.
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_ACCEPT_ENCODING = "gzip, br" if importlib.util.find_spec("brotli") is not None else "gzip"
+
+# Gabarits de prompt (préfixe constant figé une fois, seules les mesures sont formatées)
+_PROMPT_BASE = (
+    "Tu es un coach bienveillant. En une à deux phrases, donne un conseil concret, "
+    "clair et non médical, basé sur le score cognitif et les mesures du jour."
+)
+_PROMPT_NO_INPUTS = _PROMPT_BASE + "\n\nScore cognitif (SCJ): {scj:.2f}.\nRéponds en français."
+_PROMPT_WITH = (
+    _PROMPT_BASE + "\n\n"
+    "Score cognitif (SCJ): {scj:.2f}\n"
+    "Humeur: {h:.1f}/10, Stress: {st:.1f}/10, Sommeil: {s:.1f}h, Concentration: {c:.1f}/10\n"
+    "Réponds en français, 2 phrases maximum."
+)
+
+
+_MAX_ATTEMPTS = 3                                # 1 appel + 2 retries
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_BREAKER_THRESHOLD = 5                           # échecs consécutifs avant ouverture
+_BREAKER_COOLDOWN_SEC = 60.0
+
 class HuggingFaceProvider:
     """
     Client simple pour l'Inference API de Hugging Face.
@@ -107,48 +197,69 @@ class HuggingFaceProvider:
 
     Notes:
         - Nécessite `httpx` installé.
-        - S'il y a la moindre erreur réseau, on relèvera l'exception afin
-          que l'appelant puisse fallback vers le Stub selon sa politique.
+        - Les erreurs transitoires (timeout, 429, 5xx) sont réessayées jusqu'à 3 fois
+          avec backoff exponentiel ; après 5 appels consécutifs en échec transitoire
+          (retries épuisés), le provider refuse les appels pendant 60 s.
+        - Sinon, l'exception est relevée afin que l'appelant puisse fallback
+          vers le Stub selon sa politique.
     """
 
     def __init__(self) -> None:
-        if httpx is None:
-            raise RuntimeError("httpx n'est pas installé. `pip install httpx` pour utiliser HuggingFaceProvider.")
+        _require_httpx()
 
-        self.token = os.getenv("HF_TOKEN", "").strip()
+        cfg = _load_hf_config()
+        self.token = cfg.token
         if not self.token:
             raise RuntimeError("HF_TOKEN manquant pour HuggingFaceProvider.")
 
-        self.model = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2").strip()
-        self.api_url = os.getenv("HF_API_URL", f"https://api-inference.huggingface.co/models/{self.model}").strip()
-        self.max_tokens = int(os.getenv("HF_MAX_TOKENS", "200"))
-        self.temperature = float(os.getenv("HF_TEMPERATURE", "0.3"))
-        self.top_p = float(os.getenv("HF_TOP_P", "0.9"))
-        self.timeout_sec = float(os.getenv("HF_TIMEOUT_SEC", "12"))
+        self.model = cfg.model
+        self.api_url = cfg.api_url
+        self.max_tokens = cfg.max_tokens
+        self.temperature = cfg.temperature
+        self.top_p = cfg.top_p
+        self.timeout_sec = cfg.timeout_sec
 
         self._headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
+            "Accept-Encoding": _ACCEPT_ENCODING,
         }
 
-    def _build_prompt(self, *, scj: float, inputs: DailyInputsLite | None) -> str:
-        base = (
-            "Tu es un coach bienveillant. En une à deux phrases, donne un conseil concret, "
-            "clair et non médical, basé sur le score cognitif et les mesures du jour."
+        # Client persistant : la connexion TCP/TLS est réutilisée d'un appel à l'autre
+        self._client = self._make_client()
+
+        # Retries (erreurs transitoires) + disjoncteur après échecs consécutifs
+        self._sleep = time.sleep
+        self._consecutive_failures = 0
+        self._breaker_until = 0.0
+
+    def _make_client(self):
+        return httpx.Client(
+            timeout=self.timeout_sec,
+            headers=self._headers,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=30.0),
+            http2=_HTTP2,
         )
+
+    def close(self) -> None:
+        """Ferme le pool de connexions HTTP."""
+        self._client.close()
+
+    def __enter__(self) -> "HuggingFaceProvider":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _build_prompt(self, *, scj: float, inputs: _HasInputs | None) -> str:
         if inputs is None:
-            return f"{base}\n\nScore cognitif (SCJ): {scj:.2f}.\nRéponds en français."
-
-        return (
-            f"{base}\n\n"
-            f"Score cognitif (SCJ): {scj:.2f}\n"
-            f"Humeur: {inputs.humeur:.1f}/10, Stress: {inputs.stress:.1f}/10, "
-            f"Sommeil: {inputs.sommeil:.1f}h, Concentration: {inputs.concentration:.1f}/10\n"
-            "Réponds en français, 2 phrases maximum."
+            return _PROMPT_NO_INPUTS.format(scj=scj)
+        return _PROMPT_WITH.format(
+            scj=scj, h=inputs.humeur, st=inputs.stress, s=inputs.sommeil, c=inputs.concentration
         )
 
-    def generate(self, *, scj: float, inputs: DailyInputsLite | None = None) -> str:
-        payload = {
+    def _build_payload(self, *, scj: float, inputs: _HasInputs | None) -> dict:
+        return {
             "inputs": self._build_prompt(scj=scj, inputs=inputs),
             "parameters": {
                 "max_new_tokens": self.max_tokens,
@@ -161,12 +272,8 @@ class HuggingFaceProvider:
             "options": {"wait_for_model": True},
         }
 
-        # Appel réseau
-        with httpx.Client(timeout=self.timeout_sec) as client:
-            resp = client.post(self.api_url, headers=self._headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-
+    @staticmethod
+    def _extract_text(data) -> str:
         # Formats possibles : liste de dicts [{"generated_text": "..."}] ou autre
         if isinstance(data, list) and data and "generated_text" in data[0]:
             return str(data[0]["generated_text"]).strip()
@@ -179,7 +286,122 @@ class HuggingFaceProvider:
                     return data[key].strip()
 
         # Fallback: renvoyer du JSON brut lisible
-        return json.dumps(data, ensure_ascii=False)[:500].strip()
+        return _json_dumps(data)[:500].strip()
+
+    @staticmethod
+    def _is_transient(exc: Exception) -> bool:
+        """Timeout / erreur de transport, ou statut HTTP 429/5xx « réessayable »."""
+        if isinstance(exc, httpx.TransportError):  # inclut TimeoutException
+            return True
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in _RETRY_STATUSES
+        return False
+
+    def _record_failure(self) -> None:
+        """Compte un appel logique en échec transitoire (retries épuisés) ; ouvre le disjoncteur au seuil."""
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= _BREAKER_THRESHOLD:
+            self._breaker_until = time.monotonic() + _BREAKER_COOLDOWN_SEC
+            self._consecutive_failures = 0
+
+    def _check_breaker(self) -> None:
+        if time.monotonic() < self._breaker_until:
+            raise RuntimeError("HuggingFace temporairement désactivé après des échecs répétés.")
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> Optional[float]:
+        """
+        Attente avant la tentative suivante, ou None s'il faut relever.
+        Une erreur non transitoire (400/401/404…) ne compte pas pour le disjoncteur ;
+        une erreur transitoire n'y compte qu'une fois par appel, retries épuisés.
+        """
+        if not self._is_transient(exc):
+            return None
+        if attempt + 1 >= _MAX_ATTEMPTS:
+            self._record_failure()
+            return None
+        return min(8.0, 2.0 ** attempt) + random.random() * 0.2
+
+    def _post_json(self, payload: dict):
+        """POST avec retries (backoff exponentiel plafonné + jitter) et disjoncteur."""
+        self._check_breaker()
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                # Appel réseau (connexion réutilisée via le pool du client)
+                resp = self._client.post(self.api_url, json=payload)
+                resp.raise_for_status()
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+                self._sleep(delay)
+            else:
+                self._consecutive_failures = 0
+                return _json_loads(resp.content)
+
+    def generate(self, *, scj: float, inputs: _HasInputs | None = None) -> str:
+        payload = self._build_payload(scj=scj, inputs=inputs)
+        return self._extract_text(self._post_json(payload))
+
+    def generate_stream(self, *, scj: float, inputs: _HasInputs | None = None) -> Iterator[str]:
+        """
+        Variante streaming (SSE) : rend les tokens au fil de l'eau, le premier arrive
+        après un seul token décodé au lieu de la réponse complète. Pas de retry
+        (un flux partiellement consommé ne se rejoue pas), mais le disjoncteur s'applique.
+        """
+        self._check_breaker()
+        payload = {**self._build_payload(scj=scj, inputs=inputs), "stream": True}
+        try:
+            with self._client.stream("POST", self.api_url, json=payload) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if not data or data == "[DONE]":
+                        continue
+                    token = _json_loads(data).get("token") or {}
+                    if token.get("special"):
+                        continue
+                    text = token.get("text", "")
+                    if text:
+                        yield text
+        except Exception as exc:
+            if self._is_transient(exc):
+                self._record_failure()
+            raise
+        self._consecutive_failures = 0
+
+
+# -----------------------------------------------------------------------------
+# Provider HF partagé (un seul client HTTP par process)
+# -----------------------------------------------------------------------------
+
+_hf_provider: Optional[HuggingFaceProvider] = None
+_hf_provider_lock = threading.Lock()
+
+
+def _get_hf_provider_singleton() -> HuggingFaceProvider:
+    global _hf_provider
+    if _hf_provider is None:
+        with _hf_provider_lock:
+            if _hf_provider is None:
+                _hf_provider = HuggingFaceProvider()
+    return _hf_provider
+
+
+def _reset_hf_provider() -> None:
+    """
+    Ferme et oublie le provider partagé (le prochain AIService en recrée un).
+    Seul point de fermeture du client partagé : appelé à l'arrêt du process (atexit).
+    """
+    global _hf_provider
+    with _hf_provider_lock:
+        provider, _hf_provider = _hf_provider, None
+    if provider is not None:
+        provider.close()
+
+
+atexit.register(_reset_hf_provider)
 
 
 # -----------------------------------------------------------------------------
@@ -203,18 +425,46 @@ class AIService:
         prov = os.getenv("AI_PROVIDER", "stub").strip().lower()
         if prov == "hf":
             try:
-                self._provider = HuggingFaceProvider()
+                self._provider = _get_hf_provider_singleton()
             except Exception:
                 # Fallback silencieux vers le stub si la config HF est incomplète
                 self._provider = StubProvider()
         else:
             self._provider = StubProvider()
 
+    def close(self) -> None:
+        """
+        Libère les ressources du provider (ex. pool HTTP) s'il en possède.
+        No-op pour le provider HF partagé : d'autres AIService l'utilisent encore
+        (il est fermé à l'arrêt du process par _reset_hf_provider).
+        """
+        if self._provider is _hf_provider:
+            return
+        close = getattr(self._provider, "close", None)
+        if callable(close):
+            close()
+
+
+    # --- dédoublonnage (generate_many) ----------------------------------------
+
+    @staticmethod
+    def _job_key(scj: float, inputs: Optional[_HasInputs]) -> tuple:
+        """
+        Clé exacte d'un job : SCJ borné à [0, 10] (sans arrondi) et tuple (h, s, st, c) des mesures.
+        Seuls des jobs identiques sont regroupés (6 et 6.0 partagent la clé).
+        """
+        scj_safe = float(max(0.0, min(10.0, scj)))
+        if inputs is None:
+            return (scj_safe, None)
+        return (scj_safe, (inputs.humeur, inputs.sommeil, inputs.stress, inputs.concentration))
+
+    # --- génération ----------------------------------------------------------
+
     def generate_interpretation(
         self,
         *,
         scj: float,
-        inputs: Optional[DailyInputsLite] = None,
+        inputs: Optional[_HasInputs] = None,
     ) -> str:
         """
         Génère un texte court d'interprétation (2 phrases max idéalement).
@@ -229,3 +479,54 @@ class AIService:
         # garde-fou : borne un minimum le score
         scj_safe = float(max(0.0, min(10.0, scj)))
         return self._provider.generate(scj=scj_safe, inputs=inputs)
+
+    def generate_interpretation_stream(
+        self,
+        *,
+        scj: float,
+        inputs: Optional[_HasInputs] = None,
+    ) -> Iterator[str]:
+        """
+        Comme generate_interpretation, mais rend le texte par morceaux (ex. `st.write_stream`).
+        Les providers sans streaming (Stub, provider custom) rendent le texte en un seul morceau.
+        """
+        stream = getattr(self._provider, "generate_stream", None)
+        if not callable(stream):
+            yield self.generate_interpretation(scj=scj, inputs=inputs)
+            return
+        yield from stream(scj=float(max(0.0, min(10.0, scj))), inputs=inputs)
+
+    async def generate_many(
+        self,
+        jobs: Sequence[Tuple[float, Optional[_HasInputs]]],
+        *,
+        concurrency: int = 16,
+    ) -> List[str]:
+        """
+        Génère les interprétations de plusieurs (scj, inputs) en parallèle, dans l'ordre des jobs.
+
+        - jobs identiques (même SCJ borné, mêmes mesures) : une seule génération ;
+        - provider async (`agenerate`) : requêtes concurrentes sur le même event loop ;
+        - provider sync réseau (HuggingFaceProvider) : appels délégués à des threads ;
+        - StubProvider : appel direct (aucune I/O).
+        Au plus `concurrency` appels en vol à la fois.
+        """
+        sem = asyncio.Semaphore(concurrency)
+        agenerate = getattr(self._provider, "agenerate", None)
+        offload = isinstance(self._provider, HuggingFaceProvider)
+
+        async def _one(scj: float, inputs: Optional[_HasInputs]) -> str:
+            async with sem:
+                if agenerate is not None:
+                    return await agenerate(scj=float(max(0.0, min(10.0, scj))), inputs=inputs)
+                if offload:
+                    return await asyncio.to_thread(self.generate_interpretation, scj=scj, inputs=inputs)
+                return self.generate_interpretation(scj=scj, inputs=inputs)
+
+        # Premier job de chaque clé : le provider reçoit les valeurs d'origine de l'appelant
+        keys = [self._job_key(scj, inputs) for scj, inputs in jobs]
+        unique: dict = {}
+        for key, job in zip(keys, jobs):
+            unique.setdefault(key, job)
+        results = dict(zip(unique, await asyncio.gather(*(_one(*job) for job in unique.values()))))
+        return [results[k] for k in keys]
@@ -2,8 +2,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import bisect
+import functools
 from dataclasses import dataclass
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+
+import numpy as np
 
 # Échelles par défaut
 MIN_SCALE = 0.0
@@ -18,8 +23,15 @@ DEFAULT_WEIGHTS: Dict[str, float] = {
     "stress": -1.0,  # négatif => le stress fait baisser le score
 }
 
+# Constantes précalculées pour le chemin "poids par défaut" (le plus fréquent)
+# (_compute_scj_default déroule ces poids : 2*c == c+c, 1*x == x et -1*x == -x sont exacts en IEEE)
+if tuple(DEFAULT_WEIGHTS[k] for k in ("concentration", "humeur", "sommeil", "stress")) != (2.0, 1.0, 1.0, -1.0):
+    raise RuntimeError("DEFAULT_WEIGHTS modifiés : mettre à jour _compute_scj_default")
+_DEFAULT_DENOM = sum(abs(v) for v in DEFAULT_WEIGHTS.values())
+_DEFAULT_WEIGHTS_VIEW = MappingProxyType(DEFAULT_WEIGHTS)  # partagé, non modifiable
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class DailyInput:
     """Entrées d'une journée utilisateur."""
     humeur: float           # 0..10
@@ -27,38 +39,100 @@ class DailyInput:
     stress: float           # 0..10
     concentration: float    # 0..10
 
+    def __post_init__(self) -> None:
+        # Validation une seule fois, à la construction (objet figé => reste valide ensuite).
+        # Test combiné rapide ; validate_input ne sert qu'à produire le message détaillé.
+        if not (
+            MIN_SCALE <= self.humeur <= MAX_SCALE
+            and MIN_SCALE <= self.stress <= MAX_SCALE
+            and MIN_SCALE <= self.concentration <= MAX_SCALE
+            and 0.0 <= self.sommeil <= MAX_SLEEP_HOURS
+        ):
+            validate_input(self)
+
 
 @dataclass(frozen=True)
 class ScoreResult:
     """Résultat du calcul du score."""
     scj: float              # Score Cognitif Journalier (0..10)
     raw: float              # valeur avant arrondi
-    weights: Dict[str, float]
+    weights: Mapping[str, float]
 
 
 class InputValidationError(ValueError):
-    """Erreur de validation des données d'entrée."""
+    """
+    Erreur de validation des données d'entrée.
+    `field` : premier champ fautif (nom d'attribut), `value` : valeur(s) fautive(s),
+    `fields` : tous les champs fautifs (pour regrouper les erreurs sans parser le message).
+    """
 
+    def __init__(self, field: str, value, msg: Optional[str] = None, fields: Optional[tuple] = None):
+        super().__init__(msg or f"{field} hors bornes: {value}")
+        self.field = field
+        self.value = value
+        self.fields = fields or (field,)
 
-def _clamp(value: float, low: float, high: float) -> float:
-    return max(low, min(high, value))
 
+def _clamp_round(raw: float, lo: float, hi: float, rounding: int) -> float:
+    """Borne `raw` à [lo, hi] puis arrondit (comparaisons inline plutôt que min/max imbriqués)."""
+    return round(lo if raw < lo else hi if raw > hi else raw, rounding)
 
-def validate_input(d: DailyInput) -> None:
-    """Valide les bornes des entrées. Lève InputValidationError si invalide."""
-    errors = []
 
-    def _check(name: str, v: float, lo: float, hi: float):
-        if not (lo <= v <= hi):
-            errors.append(f"{name} hors bornes: {v} (attendu {lo}..{hi})")
+# Champs validés : (attribut, libellé des messages, borne basse, borne haute)
+_FIELDS = (
+    ("humeur", "humeur", MIN_SCALE, MAX_SCALE),
+    ("stress", "stress", MIN_SCALE, MAX_SCALE),
+    ("concentration", "concentration", MIN_SCALE, MAX_SCALE),
+    ("sommeil", "sommeil (heures)", 0.0, MAX_SLEEP_HOURS),
+)
+
 
-    _check("humeur", d.humeur, MIN_SCALE, MAX_SCALE)
-    _check("stress", d.stress, MIN_SCALE, MAX_SCALE)
-    _check("concentration", d.concentration, MIN_SCALE, MAX_SCALE)
-    _check("sommeil (heures)", d.sommeil, 0.0, MAX_SLEEP_HOURS)
+def validate_input(d: DailyInput) -> None:
+    """
+    Valide les bornes des entrées. Lève InputValidationError si invalide.
+    (Appelée par DailyInput.__post_init__ ; reste utilisable pour des objets "DailyInput-like".)
+    """
+    errors = None  # alloué seulement en cas d'erreur ; message formaté au moment du raise
+    for attr, label, lo, hi in _FIELDS:
+        v = getattr(d, attr)
+        if not (lo <= v <= hi):
+            if errors is None:
+                errors = []
+            errors.append((attr, label, lo, hi, v))
 
     if errors:
-        raise InputValidationError("; ".join(errors))
+        raise InputValidationError(
+            errors[0][0],
+            errors[0][4],
+            "; ".join(f"{label} hors bornes: {v} (attendu {lo}..{hi})" for _, label, lo, hi, v in errors),
+            fields=tuple(e[0] for e in errors),
+        )
+
+
+@functools.lru_cache(maxsize=64)
+def _denom_for(items: tuple) -> float:
+    # Clé = items dans l'ordre du dict (et non un frozenset) : la somme flottante est faite
+    # dans le même ordre qu'avant => dénominateur identique au bit près.
+    return sum(abs(v) for _, v in items) or 1.0
+
+
+def _compute_scj_default(d: DailyInput, rounding: int, clamp_output: bool) -> ScoreResult:
+    """
+    Chemin rapide (poids par défaut) : arithmétique déroulée, pas de copie ni de lookups de dict.
+    Poids déroulés (aucune multiplication) mais mêmes arrondis flottants que le cas général,
+    dans le même ordre => résultat identique au bit près. On garde la division par 5 :
+    multiplier par 0.2 (non représentable exactement) pourrait décaler le raw d'un ulp.
+    """
+    raw_score = (d.concentration + d.concentration + d.humeur + d.sommeil - d.stress) / _DEFAULT_DENOM
+    scj = _clamp_round(raw_score, MIN_SCALE, MAX_SCALE, rounding) if clamp_output else round(raw_score, rounding)
+    return ScoreResult(scj=scj, raw=raw_score, weights=_DEFAULT_WEIGHTS_VIEW)
+
+
+@functools.lru_cache(maxsize=16384)
+def _compute_scj_cached(d: DailyInput) -> ScoreResult:
+    # DailyInput est figé (hashable) et les mesures sont quantifiées à 0.1 :
+    # peu de combinaisons distinctes, ScoreResult (figé) peut être partagé.
+    return _compute_scj_default(d, 2, True)
 
 
 def compute_scj(
@@ -75,10 +149,11 @@ def compute_scj(
 
     - Les poids sont configurables. Le dénominateur est la somme des valeurs absolues des poids,
       pour conserver naturellement une échelle comparable (0..10 environ).
-    - Les entrées sont validées et "clampées" en amont via validate_input (erreur si hors bornes).
+    - Les entrées sont validées dès la construction du DailyInput (erreur si hors bornes) :
+      aucun contrôle n'est refait pour un DailyInput ; un objet "DailyInput-like" est validé ici.
 
     Args:
-        d: DailyInput
+        d: DailyInput (ou tout objet exposant humeur, sommeil, stress, concentration)
         weights: dict facultatif {"concentration":2, "humeur":1, "sommeil":1, "stress":-1}
         rounding: décimales d'arrondi
         clamp_output: si True, borne le résultat final à [0, 10]
@@ -86,9 +161,17 @@ def compute_scj(
     Returns:
         ScoreResult(scj, raw, weights)
     """
-    validate_input(d)
+    if type(d) is not DailyInput:
+        validate_input(d)
 
-    w = dict(DEFAULT_WEIGHTS if weights is None else weights)
+    if weights is None or weights is DEFAULT_WEIGHTS:
+        # Mémoïsation réservée aux DailyInput (figés, égalité par valeurs) : un objet "DailyInput-like"
+        # peut être non hashable ou avoir un __eq__ sans rapport avec ses mesures.
+        if rounding == 2 and clamp_output and type(d) is DailyInput:
+            return _compute_scj_cached(d)
+        return _compute_scj_default(d, rounding, clamp_output)
+
+    w = dict(weights)
 
     # Numérateur (pondérations signées)
     numerator = (
@@ -98,33 +181,145 @@ def compute_scj(
         + w.get("stress", 0.0) * d.stress
     )
 
-    # Dénominateur = somme des poids en valeur absolue (préserve l'échelle)
-    denom = sum(abs(x) for x in w.values()) or 1.0
+    # Dénominateur = somme des poids en valeur absolue (préserve l'échelle), mémoïsé par jeu de poids
+    denom = _denom_for(tuple(w.items()))
 
     raw_score = numerator / denom
 
     # Optionnel : borne le score final entre 0 et 10
-    final = _clamp(raw_score, MIN_SCALE, MAX_SCALE) if clamp_output else raw_score
-    final = round(final, rounding)
+    final = _clamp_round(raw_score, MIN_SCALE, MAX_SCALE, rounding) if clamp_output else round(raw_score, rounding)
 
     return ScoreResult(scj=final, raw=raw_score, weights=w)
 
 
+def _validate_arrays(h: np.ndarray, s: np.ndarray, st: np.ndarray, c: np.ndarray) -> None:
+    """
+    Validation vectorisée commune à compute_scj_batch / compute_scj_many (mêmes bornes que _FIELDS).
+    `.field` = premier champ fautif (ordre de _FIELDS), `.fields` = tous les champs fautifs.
+    """
+    cols = {"humeur": h, "stress": st, "concentration": c, "sommeil": s}
+    failures = None
+    for attr, label, lo, hi in _FIELDS:
+        arr = cols[attr]
+        bad = (arr < lo) | (arr > hi)
+        if bad.any():
+            if failures is None:
+                failures = []
+            failures.append((attr, label, lo, hi, arr[bad]))
+    if failures:
+        attr, label, lo, hi, vals = failures[0]
+        raise InputValidationError(
+            attr,
+            vals,
+            f"{label} hors bornes: {vals.size} valeur(s), ex. {vals[0]} (attendu {lo}..{hi})",
+            fields=tuple(f[0] for f in failures),
+        )
+
+
+def compute_scj_batch(
+    humeur,
+    sommeil,
+    stress,
+    concentration,
+    weights: Optional[Dict[str, float]] = None,
+    rounding: int = 2,
+    clamp_output: bool = True,
+) -> np.ndarray:
+    """
+    Version vectorisée de compute_scj : prend 4 tableaux (même longueur) et renvoie les SCJ arrondis.
+
+    Même formule, mêmes bornes et mêmes opérations flottantes (float64) que compute_scj ;
+    une seule validation sur l'ensemble des tableaux.
+    """
+    h, s, st, c = (np.asarray(a, dtype=np.float64) for a in (humeur, sommeil, stress, concentration))
+    _validate_arrays(h, s, st, c)
+
+    w = DEFAULT_WEIGHTS if weights is None else weights
+    denom = _DEFAULT_DENOM if w is DEFAULT_WEIGHTS else _denom_for(tuple(w.items()))
+    raw = (
+        w.get("concentration", 0.0) * c
+        + w.get("humeur", 0.0) * h
+        + w.get("sommeil", 0.0) * s
+        + w.get("stress", 0.0) * st
+    ) / denom
+    if clamp_output:
+        np.clip(raw, MIN_SCALE, MAX_SCALE, out=raw)
+    return np.round(raw, rounding)
+
+
+# Ordre des colonnes attendu par compute_scj_many et poids associés (noyau Numba)
+_COLUMNS = ("humeur", "sommeil", "stress", "concentration")
+_DEFAULT_W_VEC = np.array([DEFAULT_WEIGHTS[k] for k in _COLUMNS], dtype=np.float64)
+
+
+def compute_scj_many(
+    inputs,
+    weights: Optional[Dict[str, float]] = None,
+    rounding: int = 2,
+    clamp_output: bool = True,
+    use_numba: bool = False,
+) -> np.ndarray:
+    """
+    Variante matricielle de compute_scj_batch : `inputs` de forme (N, 4) en colonnes
+    (humeur, sommeil, stress, concentration), ou une séquence de DailyInput ; renvoie (N,) SCJ en float32.
+    Mêmes validation et calcul (float64) que compute_scj_batch, conversion en float32 à la fin.
+
+    use_numba=True (opt-in, ex. backfills hors ligne) : noyau Numba si installé, sinon chemin NumPy.
+    Jamais automatique : la première compilation JIT n'a rien à faire sur le chemin d'une requête.
+    """
+    if isinstance(inputs, (list, tuple)) and inputs and isinstance(inputs[0], DailyInput):
+        # Lignes construites ici (un seul tableau) plutôt qu'un ndarray par DailyInput
+        x = np.array([(d.humeur, d.sommeil, d.stress, d.concentration) for d in inputs], dtype=np.float64)
+    else:
+        x = np.asarray(inputs, dtype=np.float64)
+    if x.ndim != 2 or x.shape[1] != len(_COLUMNS):
+        raise ValueError(f"inputs doit être de forme (N, 4) {_COLUMNS}, reçu {x.shape}")
+    h, s, st, c = x.T
+
+    if use_numba:
+        from app.services.score_engine_numba import get_kernel  # import paresseux (numba optionnel)
+
+        kernel = get_kernel()
+        if kernel is not None:
+            _validate_arrays(h, s, st, c)
+            if weights is None or weights is DEFAULT_WEIGHTS:
+                w_vec, denom = _DEFAULT_W_VEC, _DEFAULT_DENOM
+            else:
+                w_vec = np.array([weights.get(k, 0.0) for k in _COLUMNS], dtype=np.float64)
+                denom = _denom_for(tuple(weights.items()))
+            out = kernel(np.ascontiguousarray(x), w_vec, float(denom), MIN_SCALE, MAX_SCALE, clamp_output, rounding)
+            return out.astype(np.float32)
+
+    return compute_scj_batch(h, s, st, c, weights=weights, rounding=rounding, clamp_output=clamp_output).astype(
+        np.float32
+    )
+
+
+# Tranches d'interprétation : seuils (borne basse incluse) et messages associés
+_THRESHOLDS = (4.0, 5.5, 7.0, 8.5)
+_MESSAGES = (
+    "Fatigue cognitive marquée. Sommeil, hydratation et pause longue recommandés.",
+    "Baisse de régime. Privilégie les tâches simples et récupère.",
+    "État correct. Garde des pauses régulières pour rester stable.",
+    "Bonne clarté d'esprit. Planifie 1–2 blocs de deep work.",
+    "Énergie mentale très élevée. Profite de ce pic pour les tâches complexes.",
+)
+_MESSAGES_ARR = np.array(_MESSAGES)
+
+
 def interpret_scj(scj: float) -> str:
     """
     Retourne une interprétation courte du score.
     (Tu pourras plus tard la remplacer par la génération IA.)
     """
-    s = _clamp(scj, MIN_SCALE, MAX_SCALE)
-    if s >= 8.5:
-        return "Énergie mentale très élevée. Profite de ce pic pour les tâches complexes."
-    if s >= 7.0:
-        return "Bonne clarté d'esprit. Planifie 1–2 blocs de deep work."
-    if s >= 5.5:
-        return "État correct. Garde des pauses régulières pour rester stable."
-    if s >= 4.0:
-        return "Baisse de régime. Privilégie les tâches simples et récupère."
-    return "Fatigue cognitive marquée. Sommeil, hydratation et pause longue recommandés."
+    s = MIN_SCALE if scj < MIN_SCALE else MAX_SCALE if scj > MAX_SCALE else scj  # clamp inliné
+    return _MESSAGES[bisect.bisect_right(_THRESHOLDS, s)]
+
+
+def interpret_scj_batch(scj) -> np.ndarray:
+    """Version vectorisée de interpret_scj : un message par score (mêmes tranches)."""
+    idx = np.searchsorted(_THRESHOLDS, np.asarray(scj, dtype=np.float64), side="right")
+    return np.take(_MESSAGES_ARR, idx)
 
 
 # --- Démo locale (facultative) ---
@@ -0,0 +1,39 @@
+# app/services/score_engine_numba.py
+# -*- coding: utf-8 -*-
+"""
+Noyau Numba (optionnel) pour compute_scj_many sur de gros volumes (backfills 10k+ lignes).
+
+Numba n'est pas une dépendance du projet : le module s'importe sans lui et get_kernel()
+renvoie alors None (compute_scj_many reste sur le chemin NumPy).
+"""
+from __future__ import annotations
+
+import functools
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=1)
+def get_kernel():
+    """Compile (une fois par process) et renvoie le noyau, ou None si numba n'est pas installé."""
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    # Pas de fastmath : il autoriserait la réassociation des flottants et ferait diverger
+    # les arrondis du chemin NumPy / scalaire.
+    @njit(parallel=True, cache=True)
+    def _scj_kernel(x, w, denom, lo, hi, clamp_output, rounding):
+        n = x.shape[0]
+        raw = np.empty(n, dtype=np.float64)
+        for i in prange(n):
+            r = (x[i, 0] * w[0] + x[i, 1] * w[1] + x[i, 2] * w[2] + x[i, 3] * w[3]) / denom
+            if clamp_output:
+                r = lo if r < lo else (hi if r > hi else r)
+            raw[i] = r
+        out = np.empty(n, dtype=np.float64)
+        np.round(raw, rounding, out)
+        return out
+
+    return _scj_kernel
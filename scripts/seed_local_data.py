@@ -14,8 +14,8 @@ Utilise :
 - app/persistence/db.py            -> init_db()
 - app/persistence/models.py        -> Base
 - app/persistence/repositories/... -> UserRepository, RecordRepository
-- app/services/score_engine.py     -> DailyInput, compute_scj
-- app/services/ai_service.py       -> AIService, DailyInputsLite (si --with-ai)
+- app/services/score_engine.py     -> DailyInput, compute_scj_batch
+- app/services/ai_service.py       -> AIService (si --with-ai)
 
 Exemples :
     # 3 users, 14 jours jusqu’à aujourd’hui, sans interprétation IA
@@ -34,11 +34,14 @@ Exemples :
 from __future__ import annotations
 
 import argparse
+import asyncio
 import datetime as dt
 import os
-import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Optional
 
+import numpy as np
+
 # Persistance & modèles
 from app.persistence.db import init_db
 from app.persistence.models import Base
@@ -46,10 +49,10 @@ from app.persistence.repositories.users_repo import UserRepository
 from app.persistence.repositories.records_repo import RecordRepository
 
 # Moteur de score
-from app.services.score_engine import DailyInput, compute_scj
+from app.services.score_engine import DailyInput, compute_scj_batch
 
 # Service IA (optionnel si --with-ai)
-from app.services.ai_service import AIService, DailyInputsLite
+from app.services.ai_service import AIService
 
 
 # -------------------------------------------------------------------
@@ -60,27 +63,24 @@ def clamp(x: float, lo: float, hi: float) -> float:
     return max(lo, min(hi, x))
 
 
-def rand_in_range(lo: float, hi: float) -> float:
-    """Uniforme [lo, hi]."""
-    return random.uniform(lo, hi)
+# Générateur par défaut du module (remplacé par un générateur seedé via --seed).
+# Tous les tirages passent par une instance de générateur : aucun état global `random`.
+_rng = np.random.default_rng()
 
 
-def sample_day_inputs() -> DailyInput:
+def sample_day_inputs_batch(n: int, rng: Optional[np.random.Generator] = None):
     """
-    Génère un jeu d'inputs "réaliste" pour une journée.
+    Génère `n` journées d'inputs "réalistes" d'un coup (tableaux NumPy, arrondis à 0.1).
     - humeur, stress, concentration : 0..10
     - sommeil : 4..9h (on reste raisonnable)
+    Retourne (humeur, sommeil, stress, concentration).
     """
-    humeur = clamp(random.gauss(6.5, 1.6), 0.0, 10.0)
-    stress = clamp(random.gauss(4.0, 2.0), 0.0, 10.0)
-    concentration = clamp(random.gauss(6.0, 1.8), 0.0, 10.0)
-    sommeil = clamp(random.gauss(7.0, 1.2), 4.0, 9.0)  # heures
-    return DailyInput(
-        humeur=round(humeur, 1),
-        sommeil=round(sommeil, 1),
-        stress=round(stress, 1),
-        concentration=round(concentration, 1),
-    )
+    rng = rng if rng is not None else _rng
+    humeur = np.clip(rng.normal(6.5, 1.6, n), 0.0, 10.0).round(1)
+    stress = np.clip(rng.normal(4.0, 2.0, n), 0.0, 10.0).round(1)
+    concentration = np.clip(rng.normal(6.0, 1.8, n), 0.0, 10.0).round(1)
+    sommeil = np.clip(rng.normal(7.0, 1.2, n), 4.0, 9.0).round(1)  # heures
+    return humeur, sommeil, stress, concentration
 
 
 def daterange(end: dt.date, days: int):
@@ -93,6 +93,22 @@ def daterange(end: dt.date, days: int):
 # Seeding
 # -------------------------------------------------------------------
 
+def _seed_one_user(days: int, end_date: dt.date, gap_rate: float, random_seed: Optional[int]):
+    """
+    Tirages + scores vectorisés (NumPy) pour tous les jours d'un utilisateur, sans accès DB
+    (exécuté dans un process worker). Retourne [(jour, DailyInput, scj), ...].
+    """
+    rng = np.random.default_rng(random_seed)
+    # Probabilité de "jour manquant" pour simuler des trous dans les séries
+    kept_days = [d for d, keep in zip(daterange(end=end_date, days=days), rng.random(days) >= gap_rate) if keep]
+    humeur, sommeil, stress, concentration = sample_day_inputs_batch(len(kept_days), rng)
+    scjs = compute_scj_batch(humeur, sommeil, stress, concentration)
+    return [
+        (day, DailyInput(humeur=float(h), sommeil=float(sl), stress=float(st), concentration=float(c)), float(scj))
+        for day, h, sl, st, c, scj in zip(kept_days, humeur, sommeil, stress, concentration, scjs)
+    ]
+
+
 def seed(
     *,
     users: int,
@@ -102,10 +118,18 @@ def seed(
     domain: str,
     gap_rate: float,
     with_ai: bool,
+    random_seed: Optional[int] = None,
+    workers: int = 1,
 ) -> None:
     """
     Remplit la base avec `users` utilisateurs, chacun ayant jusqu'à `days` enregistrements,
     avec des trous éventuels (gap_rate). Les enregistrements sont upsertés : réentrant.
+
+    Les tirages/scores sont calculés dans le process principal par défaut (quelques centaines de
+    tirages par utilisateur : un pool coûterait plus qu'il ne rapporte). Sur demande (`workers` > 1,
+    ou 0 = nb de CPU), ils sont répartis par utilisateur sur un pool de process. L'utilisateur i
+    utilise la graine `random_seed + i` (reproductible, avec ou sans pool). Les écritures DB
+    restent dans le process principal.
     """
     user_repo = UserRepository()
     rec_repo = RecordRepository()
@@ -114,33 +138,45 @@ def seed(
     print(f"➡️  Seeding {users} user(s), {days} jour(s), fin au {end_date.isoformat()}"
           f" | gaps ~{int(gap_rate*100)}% | AI={'on' if with_ai else 'off'}")
 
-    total_records = 0
+    seeded_users = []
     for i in range(1, users + 1):
         email = f"{email_prefix}{i}@{domain}".lower()
         u = user_repo.get_or_create(email, is_premium=(i % 3 == 0))  # 1/3 premium pour varier
         print(f"   • User {u.id:>3}  {u.email:<30}  premium={u.is_premium}")
+        seeded_users.append(u)
+
+    # 1) Génération par utilisateur (pool de process seulement si demandé)
+    args = [(days, end_date, gap_rate, None if random_seed is None else random_seed + i)
+            for i in range(1, users + 1)]
+    max_workers = min(users, workers if workers > 0 else (os.cpu_count() or 1))
+    plans: list = [None] * users
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_seed_one_user, *a): idx for idx, a in enumerate(args)}
+            for fut in as_completed(futures):
+                plans[futures[fut]] = fut.result()
+    else:
+        plans = [_seed_one_user(*a) for a in args]
+
+    # 2) Interprétations IA : tous les utilisateurs dans un seul asyncio.run (I/O réseau superposées).
+    # Ré-exécution : les jours déjà interprétés gardent leur texte, sans nouvel appel IA.
+    to_generate_by_user, kept_by_user = [], []
+    for u, planned in zip(seeded_users, plans):
+        existing = rec_repo.existing_dates_with_interpretation(u.id) if ai is not None else set()
+        to_generate_by_user.append([p for p in planned if p[0] not in existing])
+        kept_by_user.append([p for p in planned if p[0] in existing])
+
+    # DailyInput satisfait le protocole attendu par AIService : pas de copie
+    jobs = [(scj, inputs) for to_generate in to_generate_by_user for _, inputs, scj in to_generate]
+    all_interpretations = asyncio.run(ai.generate_many(jobs)) if ai is not None and jobs else [None] * len(jobs)
+    interpretations_iter = iter(all_interpretations)
 
-        for day in daterange(end=end_date, days=days):
-            # Probabilité de "jour manquant" pour simuler des trous dans les séries
-            if random.random() < gap_rate:
-                continue
-
-            inputs = sample_day_inputs()
-            scj = compute_scj(inputs).scj
-
-            interpretation: Optional[str] = None
-            if ai is not None:
-                interpretation = ai.generate_interpretation(
-                    scj=scj,
-                    inputs=DailyInputsLite(
-                        humeur=inputs.humeur,
-                        sommeil=inputs.sommeil,
-                        stress=inputs.stress,
-                        concentration=inputs.concentration,
-                    ),
-                )
-
-            rec_repo.upsert(
+    total_records = 0
+    for u, to_generate, kept in zip(seeded_users, to_generate_by_user, kept_by_user):
+        # 3) Écriture : upserts en lot par utilisateur (sans la colonne interpretation
+        # pour les jours conservés, afin de ne pas l'écraser)
+        def _row(day, inputs, scj):
+            return dict(
                 user_id=u.id,
                 date=day,
                 humeur=inputs.humeur,
@@ -148,9 +184,11 @@ def seed(
                 stress=inputs.stress,
                 concentration=inputs.concentration,
                 scj=float(scj),
-                interpretation=interpretation,
             )
-            total_records += 1
+
+        batch = [{**_row(*p), "interpretation": next(interpretations_iter)} for p in to_generate]
+        total_records += rec_repo.upsert_many(batch)
+        total_records += rec_repo.upsert_many([_row(*p) for p in kept])
 
     print(f"✅ Terminé : {users} user(s), {total_records} record(s) créés/mis à jour.")
 
@@ -168,6 +206,8 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--domain", type=str, default="example.com", help="Domaine email (défaut: example.com)")
     p.add_argument("--gap-rate", type=float, default=0.1, help="Probabilité de sauter un jour (0..1, défaut: 0.1)")
     p.add_argument("--seed", type=int, default=None, help="Seed du générateur aléatoire pour reproductibilité")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Nombre de process pour la génération (défaut: 1 = sans pool ; 0 = nb de CPU)")
     p.add_argument("--with-ai", action="store_true", help="Générer une interprétation IA (Stub/HF selon env)")
     p.add_argument("--wipe", action="store_true", help="Drop + recreate la base avant seeding")
     return p.parse_args()
@@ -176,10 +216,6 @@ def parse_args() -> argparse.Namespace:
 def main():
     args = parse_args()
 
-    # Seed random si demandé
-    if args.seed is not None:
-        random.seed(args.seed)
-
     # Date de fin
     end_date = dt.date.fromisoformat(args.end) if args.end else dt.date.today()
 
@@ -199,6 +235,8 @@ def main():
         domain=args.domain,
         gap_rate=clamp(args.gap_rate, 0.0, 0.9),
         with_ai=bool(args.with_ai),
+        random_seed=args.seed,
+        workers=args.workers,
     )
 
 
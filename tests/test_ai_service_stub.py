@@ -24,10 +24,12 @@ Notes :
 
 from __future__ import annotations
 
+import asyncio
 import os
 import types
 import json
 
+import httpx
 import pytest
 
 # On importe les classes/fonctions à tester
@@ -60,7 +62,12 @@ def clean_env(monkeypatch):
         "HF_TIMEOUT_SEC",
     ]:
         monkeypatch.delenv(key, raising=False)
+    # Config HF et provider partagé sont mis en cache au niveau du process
+    ai_svc._load_hf_config.cache_clear()
+    ai_svc._hf_provider = None
     yield
+    ai_svc._load_hf_config.cache_clear()
+    ai_svc._hf_provider = None
 
 
 # ---------------------------------------------------------------------
@@ -161,6 +168,70 @@ def test_aiservice_clamps_scj_for_any_provider(monkeypatch):
     assert spy.last_scj == 0.0
 
 
+def test_aiservice_generate_many_keeps_order_with_stub():
+    """
+    generate_many renvoie un texte par job, dans l'ordre, identique à l'appel unitaire.
+    """
+    svc = AIService(provider=StubProvider())
+    jobs = [(9.0, None), (3.0, DailyInputsLite(6, 5, 8, 5)), (12.0, None)]
+    out = asyncio.run(svc.generate_many(jobs))
+    assert out == [svc.generate_interpretation(scj=s, inputs=i) for s, i in jobs]
+
+
+def test_aiservice_generate_many_runs_async_provider_concurrently():
+    """
+    Avec un provider async, les appels se chevauchent, dans la limite de `concurrency`.
+    """
+    class AsyncSpy:
+        def __init__(self):
+            self.in_flight = 0
+            self.peak = 0
+
+        async def agenerate(self, *, scj, inputs=None):
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return f"{scj:.1f}"
+
+    spy = AsyncSpy()
+    svc = AIService(provider=spy)
+    out = asyncio.run(svc.generate_many([(float(i), None) for i in range(10)], concurrency=4))
+    assert out == [f"{float(i):.1f}" for i in range(10)]
+    assert spy.peak == 4
+
+
+def test_aiservice_generate_many_dedups_identical_jobs_only():
+    """
+    generate_many regroupe les jobs identiques (même SCJ borné, mêmes mesures) ; le provider
+    reçoit les valeurs d'origine, donc la réponse est celle du provider seul.
+    """
+    class CountingProvider:
+        def __init__(self):
+            self.calls = []
+
+        def generate(self, *, scj, inputs=None):
+            self.calls.append((scj, inputs))
+            return f"appel {len(self.calls)}"
+
+    prov = CountingProvider()
+    svc = AIService(provider=prov)
+    near = DailyInputsLite(6, 5.54, 6.96, 7)
+    out = asyncio.run(svc.generate_many([
+        (7.0, DailyInputsLite(6, 7, 3, 7)),
+        (7.0, DailyInputsLite(6.0, 7.0, 3.0, 7.0)),  # identique
+        (12.0, None),
+        (10.0, None),                                # identique après borne à 10
+        (6.996, near),                               # proche mais distinct
+    ]))
+    assert out == ["appel 1", "appel 1", "appel 2", "appel 2", "appel 3"]
+    assert prov.calls[2] == (6.996, near)  # valeurs d'origine, pas de clé arrondie
+
+    # pas de cache entre appels : le provider est toujours interrogé
+    svc.generate_interpretation(scj=7.0, inputs=DailyInputsLite(6, 7, 3, 7))
+    assert len(prov.calls) == 4
+
+
 # ---------------------------------------------------------------------
 # 3) Tests HuggingFaceProvider (avec mock httpx, SANS réseau)
 # ---------------------------------------------------------------------
@@ -168,14 +239,12 @@ def test_aiservice_clamps_scj_for_any_provider(monkeypatch):
 class _FakeResponse:
     """
     Réponse factice qui imite l'API httpx.Response nécessaire à notre usage :
-      - .json()
+      - .content (corps brut, décodé par le provider)
       - .raise_for_status() (no-op si statut OK)
     """
     def __init__(self, payload):
         self._payload = payload
-
-    def json(self):
-        return self._payload
+        self.content = json.dumps(payload).encode("utf-8")
 
     def raise_for_status(self):
         return None  # no-op
@@ -183,21 +252,33 @@ class _FakeResponse:
 
 class _FakeClient:
     """
-    Client factice utilisé via le context manager "with httpx.Client(...) as client:"
+    Client factice persistant (créé une fois dans HuggingFaceProvider.__init__).
     """
     def __init__(self, *, payload_to_return):
         self.payload_to_return = payload_to_return
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc, tb):
-        return False  # ne supprime pas les exceptions
+        self.calls = 0
+        self.closed = False
 
     def post(self, url, headers=None, json=None):
         # On pourrait vérifier ici les headers/token si besoin
+        if self.closed:
+            raise RuntimeError("Cannot send a request, as the client has been closed.")
+        self.calls += 1
         return _FakeResponse(self.payload_to_return)
 
+    def close(self):
+        self.closed = True
+
+
+def _fake_httpx(client_factory):
+    """Module httpx factice : Client(**kwargs) délègue à la factory ; exceptions réelles de httpx."""
+    return types.SimpleNamespace(
+        Client=lambda **kwargs: client_factory(),
+        Limits=lambda **kwargs: None,
+        TransportError=httpx.TransportError,
+        HTTPStatusError=httpx.HTTPStatusError,
+    )
+
 
 def test_hf_provider_parses_list_format(monkeypatch):
     """
@@ -210,9 +291,7 @@ def test_hf_provider_parses_list_format(monkeypatch):
     monkeypatch.setenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
 
     # On monkey-patche le module httpx dans ai_service en un module factice
-    fake_httpx = types.SimpleNamespace(
-        Client=lambda timeout=None: _FakeClient(payload_to_return=[{"generated_text": "Texte HF"}])
-    )
+    fake_httpx = _fake_httpx(lambda: _FakeClient(payload_to_return=[{"generated_text": "Texte HF"}]))
     monkeypatch.setattr(ai_svc, "httpx", fake_httpx, raising=True)
 
     # AIService doit construire le HuggingFaceProvider cette fois
@@ -231,9 +310,7 @@ def test_hf_provider_parses_dict_variants(monkeypatch):
     monkeypatch.setenv("HF_TOKEN", "dummy_token")
 
     # Variante: la réponse renvoie un dict avec 'text'
-    fake_httpx = types.SimpleNamespace(
-        Client=lambda timeout=None: _FakeClient(payload_to_return={"text": "Réponse variante"})
-    )
+    fake_httpx = _fake_httpx(lambda: _FakeClient(payload_to_return={"text": "Réponse variante"}))
     monkeypatch.setattr(ai_svc, "httpx", fake_httpx, raising=True)
 
     svc = AIService()
@@ -250,13 +327,10 @@ def test_hf_provider_raises_when_used_directly_and_http_fails(monkeypatch):
     """
     # On fabrique un faux httpx qui lève à l'appel .post()
     class _FailingClient:
-        def __init__(self): ...
-        def __enter__(self): return self
-        def __exit__(self, *args): return False
         def post(self, *args, **kwargs):
             raise RuntimeError("échec réseau simulé")
 
-    fake_httpx = types.SimpleNamespace(Client=lambda timeout=None: _FailingClient())
+    fake_httpx = _fake_httpx(_FailingClient)
     monkeypatch.setattr(ai_svc, "httpx", fake_httpx, raising=True)
 
     # Prépare les env pour permettre l'init HF
@@ -265,3 +339,200 @@ def test_hf_provider_raises_when_used_directly_and_http_fails(monkeypatch):
 
     with pytest.raises(RuntimeError):
         provider.generate(scj=7.0, inputs=None)
+
+
+def test_hf_provider_reuses_one_client_across_calls(monkeypatch):
+    """
+    Le client HTTP est créé une seule fois puis réutilisé (pool de connexions) ;
+    il n'est fermé qu'à l'arrêt du process (_reset_hf_provider), pas par AIService.close().
+    """
+    created = []
+
+    def factory():
+        client = _FakeClient(payload_to_return=[{"generated_text": "ok"}])
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(factory), raising=True)
+    monkeypatch.setenv("AI_PROVIDER", "hf")
+    monkeypatch.setenv("HF_TOKEN", "token")
+
+    svc = AIService()
+    for scj in (6.0, 6.5, 7.0):
+        assert svc.generate_interpretation(scj=scj) == "ok"
+
+    assert len(created) == 1
+    assert created[0].calls == 3
+    svc.close()
+    assert created[0].closed is False
+    ai_svc._reset_hf_provider()
+    assert created[0].closed is True
+
+
+def _status_error(code):
+    req = httpx.Request("POST", "https://hf.test")
+    return httpx.HTTPStatusError("erreur", request=req, response=httpx.Response(code, request=req))
+
+
+def test_hf_provider_retries_transient_errors(monkeypatch):
+    """
+    503 / timeout sont réessayés (backoff, ici sans attente réelle) ; un 400 ne l'est pas.
+    """
+    outcomes = [_status_error(503), httpx.ReadTimeout("lent"), [{"generated_text": "Enfin"}]]
+
+    class _FlakyClient:
+        def post(self, url, json=None):
+            out = outcomes.pop(0)
+            if isinstance(out, Exception):
+                raise out
+            return _FakeResponse(out)
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(_FlakyClient), raising=True)
+    monkeypatch.setenv("HF_TOKEN", "token")
+    provider = HuggingFaceProvider()
+    sleeps = []
+    provider._sleep = sleeps.append
+
+    assert provider.generate(scj=7.0) == "Enfin"
+    assert len(sleeps) == 2 and sleeps[0] < sleeps[1]
+
+    outcomes[:] = [_status_error(400)]
+    with pytest.raises(httpx.HTTPStatusError):
+        provider.generate(scj=7.0)
+    assert len(sleeps) == 2  # pas de retry sur une erreur client
+
+
+def test_hf_provider_circuit_breaker_opens_after_repeated_failures(monkeypatch):
+    """
+    Après 5 appels consécutifs en échec transitoire (3 tentatives chacun), le provider
+    refuse les appels sans toucher au réseau ; 4 appels ne suffisent pas.
+    """
+    calls = []
+
+    class _DownClient:
+        def post(self, url, json=None):
+            calls.append(url)
+            raise _status_error(503)
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(_DownClient), raising=True)
+    monkeypatch.setenv("HF_TOKEN", "token")
+    provider = HuggingFaceProvider()
+    provider._sleep = lambda _: None
+
+    for _ in range(4):
+        with pytest.raises(httpx.HTTPStatusError):
+            provider.generate(scj=7.0)
+    assert len(calls) == 12
+    assert provider._breaker_until == 0.0  # toujours fermé après 4 appels
+
+    with pytest.raises(httpx.HTTPStatusError):
+        provider.generate(scj=7.0)  # 5e appel en échec : disjoncteur ouvert
+    assert len(calls) == 15
+
+    with pytest.raises(RuntimeError, match="temporairement désactivé"):
+        provider.generate(scj=7.0)
+    assert len(calls) == 15
+
+
+def test_hf_provider_client_errors_do_not_trip_breaker(monkeypatch):
+    """
+    Un 401 (mauvais token) n'est ni réessayé ni compté pour le disjoncteur.
+    """
+    calls = []
+
+    class _UnauthorizedClient:
+        def post(self, url, json=None):
+            calls.append(url)
+            raise _status_error(401)
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(_UnauthorizedClient), raising=True)
+    monkeypatch.setenv("HF_TOKEN", "token")
+    provider = HuggingFaceProvider()
+    provider._sleep = lambda _: None
+
+    for _ in range(10):
+        with pytest.raises(httpx.HTTPStatusError):
+            provider.generate(scj=7.0)
+    assert len(calls) == 10
+    assert provider._breaker_until == 0.0
+
+
+def test_ai_service_shares_one_hf_provider(monkeypatch):
+    """
+    La config HF est lue une fois et tous les AIService partagent le même provider (et client).
+    """
+    created = []
+
+    def factory():
+        client = _FakeClient(payload_to_return=[{"generated_text": "ok"}])
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(factory), raising=True)
+    monkeypatch.setenv("AI_PROVIDER", "hf")
+    monkeypatch.setenv("HF_TOKEN", "token")
+
+    first, second = AIService(), AIService()
+    assert first._provider is second._provider
+    assert len(created) == 1
+
+    monkeypatch.setenv("HF_MAX_TOKENS", "50")
+    assert AIService()._provider.max_tokens == 200  # config mise en cache
+
+    # fermer une instance ne casse pas les autres
+    first.close()
+    assert created[0].closed is False
+    assert second.generate_interpretation(scj=5.0) == "ok"
+
+    ai_svc._reset_hf_provider()
+    assert created[0].closed is True
+    assert AIService()._provider is not second._provider
+
+
+def test_hf_generate_stream_yields_sse_tokens(monkeypatch):
+    """
+    generate_stream() lit les évènements SSE `data: {...}` et rend les tokens non spéciaux.
+    """
+    lines = [
+        'data: {"token": {"text": "Bonne", "special": false}}',
+        "",
+        'data: {"token": {"text": " journée", "special": false}}',
+        'data: {"token": {"text": "</s>", "special": true}, "generated_text": "Bonne journée"}',
+    ]
+    sent = {}
+
+    class _StreamResponse:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_lines(self):
+            return iter(lines)
+
+    class _StreamClient:
+        def stream(self, method, url, json=None):
+            sent.update(json)
+            return _StreamResponse()
+
+    monkeypatch.setattr(ai_svc, "httpx", _fake_httpx(_StreamClient), raising=True)
+    monkeypatch.setenv("AI_PROVIDER", "hf")
+    monkeypatch.setenv("HF_TOKEN", "token")
+
+    chunks = list(AIService().generate_interpretation_stream(scj=12.0))
+    assert chunks == ["Bonne", " journée"]
+    assert sent["stream"] is True
+    assert "10.00" in sent["inputs"]  # score borné comme generate_interpretation
+
+
+def test_stub_stream_yields_full_text_once():
+    """
+    Sans streaming côté provider, le texte complet arrive en un seul morceau.
+    """
+    svc = AIService(provider=StubProvider())
+    chunks = list(svc.generate_interpretation_stream(scj=7.5))
+    assert chunks == [svc.generate_interpretation(scj=7.5)]
@@ -4,7 +4,8 @@
 Tests d'intégration pour la couche persistence (SQLite/SQLAlchemy).
 
 Ce fichier couvre :
-- initialisation d'une base temporaire par exécution (DB_URL -> tmp file),
+- base temporaire créée une fois par session (en mémoire par défaut, engine dédié via db.make_engine),
+  chaque test étant isolé par une transaction annulée au teardown,
 - création utilisateur, unicité email, mise à jour du statut premium,
 - CRUD des enregistrements journaliers,
 - contrainte 1 record par jour,
@@ -20,7 +21,6 @@ app/persistence/repositories/records_repo.py
 """
 
 import datetime as dt
-import importlib
 import os
 from dataclasses import dataclass
 
@@ -36,39 +36,105 @@ from sqlalchemy.exc import IntegrityError
 class Repos:
     users: object
     records: object
+    engine: object = None
+    Session: object = None
+    connection: object = None
+
+
+# Base en mémoire par défaut (QME_TEST_INMEMORY=0 pour repasser sur un fichier temporaire)
+IN_MEMORY = os.getenv("QME_TEST_INMEMORY", "1") == "1"
+
+
+@pytest.fixture(scope="session")
+def db_engine(tmp_path_factory):
+    """
+    Engine + schéma créés une seule fois pour toute la session de tests :
+    - base SQLite en mémoire (ou un fichier temporaire si QME_TEST_INMEMORY=0)
+    - engine dédié via db.make_engine (aucun rechargement de module)
+    """
+    from sqlalchemy import event
+    from app.persistence import db, models
+
+    url = "sqlite:///:memory:" if IN_MEMORY else f"sqlite:///{tmp_path_factory.mktemp('db') / 'test_quantifyme.db'}"
+    engine = db.make_engine(url)
+
+    # pysqlite gère mal les SAVEPOINT en mode transactionnel implicite :
+    # on lui laisse l'autocommit et c'est SQLAlchemy qui émet le BEGIN.
+    @event.listens_for(engine, "connect")
+    def _no_implicit_begin(dbapi_conn, _record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _explicit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    models.Base.metadata.create_all(engine)
+
+    # Garde-fou : les PRAGMAs de performance sont bien appliqués à chaque connexion
+    # (une base en mémoire n'a pas de WAL : journal_mode y vaut toujours "memory")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == ("memory" if IN_MEMORY else "wal")
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -20000
+
+    yield engine
+    engine.dispose()
 
 
 @pytest.fixture
-def repos(tmp_path, monkeypatch) -> Repos:
+def repos(db_engine) -> Repos:
     """
-    Prépare un environnement propre :
-    - crée une base SQLite temporaire (ex: /tmp/pytest-xxxx/test_quantifyme.db)
-    - définit DB_URL AVANT de (re)charger les modules
-    - (re)charge db/models pour régénérer l'engine et les tables
-    - instancie les repositories Users/Records
+    Isole chaque test dans une transaction externe annulée au teardown :
+    - les sessions des repositories rejoignent cette transaction via des SAVEPOINT
+      (leurs commit/rollback ne portent que sur le SAVEPOINT)
+    - chaque test voit donc une base vide, sans DROP/CREATE des tables
     """
-    db_path = tmp_path / "test_quantifyme.db"
-    monkeypatch.setenv("DB_URL", f"sqlite:///{db_path}")
+    from app.persistence import db
+    from app.persistence.repositories.users_repo import UserRepository
+    from app.persistence.repositories.records_repo import RecordRepository
+
+    connection = db_engine.connect()
+    trans = connection.begin()
+    Session = db.make_session(connection)
+    Session.configure(join_transaction_mode="create_savepoint")
+    yield Repos(
+        users=UserRepository(Session),
+        records=RecordRepository(Session),
+        engine=db_engine,
+        Session=Session,
+        connection=connection,
+    )
+    trans.rollback()
+    connection.close()
+
 
-    # (Re)charger les modules d'infra et de modèles
+def test_init_db_runs_create_all_once(monkeypatch):
     import app.persistence.db as db
     import app.persistence.models as models
-    importlib.reload(db)
-    importlib.reload(models)
 
-    # Créer (ou recréer) les tables
-    db.init_db(models.Base, drop_and_recreate=True)
+    calls = []
+    monkeypatch.setattr(db, "_schema_ready", False)
+    monkeypatch.setattr(models.Base.metadata, "create_all", lambda *a, **kw: calls.append(a))
+    db.init_db(models.Base, drop_and_recreate=False)
+    db.init_db(models.Base, drop_and_recreate=False)  # déjà initialisé -> no-op
+    assert len(calls) == 1
 
-    # (Re)charger les repos (pour qu'ils utilisent bien le db.engine courant)
-    import app.persistence.repositories.users_repo as users_repo
-    import app.persistence.repositories.records_repo as records_repo
-    importlib.reload(users_repo)
-    importlib.reload(records_repo)
 
-    return Repos(
-        users=users_repo.UserRepository(),
-        records=records_repo.RecordRepository(),
-    )
+def test_file_database_uses_wal_and_persists(tmp_path):
+    """Chemin "fichier" (celui de la prod) : WAL actif et données relues après réouverture."""
+    from app.persistence import db, models
+    from app.persistence.repositories.users_repo import UserRepository
+
+    url = f"sqlite:///{tmp_path / 'disk.db'}"
+    engine = db.make_engine(url)
+    models.Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+    UserRepository(db.make_session(engine)).create("disk@example.com")
+    engine.dispose()
+
+    reopened = db.make_engine(url)
+    assert UserRepository(db.make_session(reopened)).get_by_email("disk@example.com") is not None
+    reopened.dispose()
 
 
 # ---------------------------------------------------------------------
@@ -79,6 +145,14 @@ def add_days(date: dt.date, n: int) -> dt.date:
     return date + dt.timedelta(days=n)
 
 
+def _statement_recorder(statements: list):
+    """Listener before_cursor_execute qui ignore les SAVEPOINT d'isolation de la fixture."""
+    def listener(conn, cursor, statement, *args):
+        if not statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")):
+            statements.append(statement)
+    return listener
+
+
 # ---------------------------------------------------------------------
 # TESTS UTILISATEURS
 # ---------------------------------------------------------------------
@@ -98,6 +172,29 @@ def test_get_or_create_user(repos: Repos):
     assert u1.id == u2.id
     assert repos.users.get_by_email("a@b.com").is_premium is True  # reste sur la 1re création
 
+def test_get_by_email_caches_the_id_only(repos: Repos):
+    from sqlalchemy import event
+
+    repos.users.create("cache@example.com")
+    statements = []
+    listener = _statement_recorder(statements)
+    event.listen(repos.engine, "before_cursor_execute", listener)
+    try:
+        first = repos.users.get_by_email("cache@example.com")
+        n_first = len(statements)
+        hit = repos.users.get_by_email(" CACHE@example.com ")  # id servi par le cache
+        second_call = statements[n_first:]
+    finally:
+        event.remove(repos.engine, "before_cursor_execute", listener)
+    # plus de recherche par email : get par clé primaire (même chargement que sans cache)
+    assert second_call and not any("users.email = " in sql for sql in second_call)
+    assert hit is not first and hit.id == first.id
+    assert hit.records == first.records == []  # même contrat (records chargé) hit ou miss
+
+    # les mises à jour restent visibles : seul l'id (immuable) est en cache
+    repos.users.set_premium("cache@example.com", True)
+    assert repos.users.get_by_email("cache@example.com").is_premium is True
+
 def test_unique_email_enforced(repos: Repos):
     repos.users.create("dup@example.com")
     # Le doublon doit lever une IntegrityError à la validation de la transaction
@@ -138,6 +235,17 @@ def test_add_record_uniqueness_per_day(repos: Repos):
     with pytest.raises(ValueError):
         repos.records.add(u.id, d, humeur=6, sommeil=7, stress=3, concentration=6, scj=5.2)
 
+def test_add_many_is_all_or_nothing(repos: Repos):
+    u = repos.users.create("many@example.com")
+    base = dict(humeur=6, sommeil=7, stress=3, concentration=6, scj=5.0)
+    assert repos.records.add_many(u.id, []) == 0
+    assert repos.records.add_many(u.id, [{**base, "date": "2025-02-01"}]) == 1
+
+    # Le doublon du 2025-02-01 fait échouer tout le lot : le 2025-02-02 n'est pas inséré
+    with pytest.raises(IntegrityError):
+        repos.records.add_many(u.id, [{**base, "date": dt.date(2025, 2, 2)}, {**base, "date": dt.date(2025, 2, 1)}])
+    assert repos.records.exists(u.id, dt.date(2025, 2, 2)) is False
+
 def test_upsert_record_for_date_insert_then_update(repos: Repos):
     u = repos.users.create("upsert@example.com")
     d = dt.date(2025, 3, 3)
@@ -159,6 +267,114 @@ def test_upsert_record_for_date_insert_then_update(repos: Repos):
     assert rows[0].scj == 6.4
     assert rows[0].interpretation == "Mieux"
 
+def test_upsert_is_a_single_statement(repos: Repos):
+    from sqlalchemy import event
+
+    u = repos.users.create("upsert_sql@example.com")
+    d = dt.date(2025, 3, 6)
+    fields = dict(humeur=5, sommeil=7, stress=3, concentration=6, interpretation=None)
+
+    statements = []
+    listener = _statement_recorder(statements)
+    event.listen(repos.engine, "before_cursor_execute", listener)
+    try:
+        repos.records.upsert(u.id, d, scj=4.0, **fields)  # insertion
+        rec = repos.records.upsert(u.id, d, scj=5.0, **fields)  # conflit -> mise à jour
+    finally:
+        event.remove(repos.engine, "before_cursor_execute", listener)
+
+    assert rec.scj == 5.0
+    # Un INSERT ... ON CONFLICT DO UPDATE ... RETURNING par appel, sans SELECT préalable
+    assert len(statements) == 2
+    assert all("ON CONFLICT" in sql and "RETURNING" in sql for sql in statements)
+
+def test_upsert_many_inserts_then_updates(repos: Repos):
+    u = repos.users.create("bulk@example.com")
+    d1, d2 = dt.date(2025, 3, 3), dt.date(2025, 3, 4)
+    base = dict(user_id=u.id, humeur=5, sommeil=7, stress=3, concentration=6, interpretation=None)
+
+    assert repos.records.upsert_many([{**base, "date": d1, "scj": 4.8}, {**base, "date": "2025-03-04", "scj": 5.0}]) == 2
+    assert repos.records.upsert_many([{**base, "date": d2, "scj": 7.5}]) == 1
+    assert repos.records.upsert_many([]) == 0
+
+    rows = repos.records.get_range(u.id)
+    assert [(r.date, r.scj) for r in rows] == [(d1, 4.8), (d2, 7.5)]
+
+def test_upsert_without_fields_returns_existing_row(repos: Repos):
+    u = repos.users.create("upsert_empty@example.com")
+    d = dt.date(2025, 3, 7)
+    r1 = repos.records.add(u.id, d, humeur=5, sommeil=7, stress=3, concentration=6, scj=4.8)
+
+    # Aucun champ : pas d'ON CONFLICT DO UPDATE avec un SET vide, la ligne existante est renvoyée
+    r2 = repos.records.upsert(u.id, d)
+    assert r2.id == r1.id and r2.scj == 4.8
+    assert repos.records.upsert_many([{"user_id": u.id, "date": d}]) == 1
+    assert len(repos.records.get_range(u.id)) == 1
+
+def test_upsert_portable_fallback_on_other_engines(repos: Repos, monkeypatch):
+    u = repos.users.create("upsert_other@example.com")
+    d1, d2 = dt.date(2025, 3, 8), dt.date(2025, 3, 9)
+    base = dict(humeur=5, sommeil=7, stress=3, concentration=6, interpretation=None)
+
+    # Moteur sans ON CONFLICT simulé : SELECT puis INSERT / UPDATE
+    monkeypatch.setattr(repos.engine.dialect, "name", "mysql")
+    r1 = repos.records.upsert(u.id, d1, scj=4.0, **base)
+    r2 = repos.records.upsert(u.id, d1, scj=6.0, **base)
+    assert r2.id == r1.id and r2.scj == 6.0
+
+    rows = [{**base, "user_id": u.id, "date": d, "scj": 7.0} for d in (d1, d2)]
+    assert repos.records.upsert_many(rows) == 2
+    assert [(r.date, r.scj) for r in repos.records.get_range(u.id)] == [(d1, 7.0), (d2, 7.0)]
+
+def test_existing_dates_with_interpretation(repos: Repos):
+    u = repos.users.create("interp@example.com")
+    base = dict(humeur=5, sommeil=7, stress=3, concentration=6, scj=5.0)
+    repos.records.add(u.id, dt.date(2025, 3, 1), interpretation="Texte", **base)
+    repos.records.add(u.id, dt.date(2025, 3, 2), interpretation=None, **base)
+    repos.records.add(u.id, dt.date(2025, 3, 3), interpretation="", **base)
+
+    assert repos.records.existing_dates_with_interpretation(u.id) == {dt.date(2025, 3, 1)}
+
+def test_shared_session_commits_once(repos: Repos):
+    u = repos.users.create("shared@example.com")
+    d = dt.date(2025, 3, 5)
+
+    s = repos.Session()
+    try:
+        repos.records.upsert(u.id, d, humeur=5, sommeil=7, stress=3, concentration=6, scj=4.8, session=s)
+        assert repos.records.exists(u.id, d, session=s) is True
+        s.rollback()
+    finally:
+        s.close()
+    # rien n'a été commité : la ligne n'existe pas pour une autre session
+    assert repos.records.exists(u.id, d) is False
+
+def test_request_session_commits_rolls_back_and_closes(repos: Repos):
+    from app.persistence.db import request_session
+
+    class _Rerun(BaseException):
+        """Imite les exceptions de contrôle Streamlit (st.stop / rerun)."""
+
+    # erreur : rollback (rien n'est écrit)
+    with pytest.raises(RuntimeError):
+        with request_session(repos.Session) as s:
+            repos.users.create("rq_err@example.com", session=s)
+            raise RuntimeError("boom")
+    assert repos.users.get_by_email("rq_err@example.com") is None
+
+    # arrêt volontaire du script : le travail déjà fait est commité
+    with pytest.raises(_Rerun):
+        with request_session(repos.Session) as s:
+            repos.users.create("rq_stop@example.com", session=s)
+            raise _Rerun()
+    assert repos.users.get_by_email("rq_stop@example.com") is not None
+
+    # fin normale : commit, et la session est fermée (plus d'objets suivis)
+    with request_session(repos.Session) as s:
+        repos.users.create("rq_ok@example.com", session=s)
+    assert repos.users.get_by_email("rq_ok@example.com") is not None
+    assert not s.in_transaction() and len(s.identity_map) == 0
+
 def test_delete_record(repos: Repos):
     u = repos.users.create("del@example.com")
     d = dt.date(2025, 4, 4)
@@ -178,6 +394,8 @@ def test_record_exists_and_date_normalization(repos: Repos):
     assert repos.records.exists(u.id, d) is False
     repos.records.add(u.id, "2025-05-05", humeur=5, sommeil=7, stress=3, concentration=6, scj=4.8)
     assert repos.records.exists(u.id, dt.datetime(2025, 5, 5, 10, 0)) is True  # accepte datetime aussi
+    with pytest.raises(TypeError):
+        repos.records.exists(u.id, 20250505)  # type non supporté
 
 
 # ---------------------------------------------------------------------
@@ -188,10 +406,11 @@ def test_get_records_with_date_range_and_order(repos: Repos):
     u = repos.users.create("range@example.com")
     start = dt.date(2025, 1, 1)
 
-    # 5 jours successifs
-    for i in range(5):
-        day = add_days(start, i)
-        repos.records.add(u.id, day, humeur=6, sommeil=7, stress=3, concentration=6, scj=5 + i)
+    # 5 jours successifs (insertion en lot)
+    assert repos.records.add_many(u.id, [
+        dict(date=add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5 + i)
+        for i in range(5)
+    ]) == 5
 
     # Filtre sur [J+1, J+3]
     rows = repos.records.get_range(u.id, start=add_days(start, 1), end=add_days(start, 3), asc=True)
@@ -200,11 +419,89 @@ def test_get_records_with_date_range_and_order(repos: Repos):
     rows_desc = repos.records.get_range(u.id, start=add_days(start, 1), end=add_days(start, 3), asc=False)
     assert [r.scj for r in rows_desc] == [8, 7, 6]
 
+def test_get_range_with_user_avoids_n_plus_one(repos: Repos):
+    from sqlalchemy import event
+
+    u = repos.users.create("eager@example.com")
+    start = dt.date(2025, 1, 1)
+    repos.records.add_many(u.id, [
+        dict(date=add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5.0)
+        for i in range(5)
+    ])
+
+    statements = []
+    listener = _statement_recorder(statements)
+    event.listen(repos.engine, "before_cursor_execute", listener)
+    try:
+        rows = repos.records.get_range(u.id, with_user=True)
+        assert [r.user.email for r in rows] == ["eager@example.com"] * 5
+    finally:
+        event.remove(repos.engine, "before_cursor_execute", listener)
+    assert len(statements) == 2  # records + users (selectin), quel que soit N
+
+def test_get_range_rows_returns_plain_tuples(repos: Repos):
+    u = repos.users.create("rows@example.com")
+    start = dt.date(2025, 1, 1)
+    for i in range(3):
+        repos.records.add(u.id, add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5 + i)
+
+    rows = repos.records.get_range_rows(u.id, start=start, end=add_days(start, 1), asc=False)
+    assert [tuple(r) for r in rows] == [
+        (add_days(start, 1), 6, 7, 3, 6, 6, None),
+        (start, 6, 7, 3, 6, 5, None),
+    ]
+    assert rows[0].scj == 6  # accès par nom comme un Record
+
+def test_daily_means_grouped_by_day(repos: Repos):
+    u = repos.users.create("daily@example.com")
+    start = dt.date(2025, 1, 1)
+    for i in range(3):
+        repos.records.add(u.id, add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5 + i)
+
+    rows = repos.records.daily_means(u.id, start=add_days(start, 1), end=add_days(start, 2))
+    assert rows == [
+        (add_days(start, 1), 6.0, 6.0, 3.0, 6.0),
+        (add_days(start, 2), 7.0, 6.0, 3.0, 6.0),
+    ]
+
+def test_daily_means_arrays_columnar(repos: Repos):
+    import numpy as np
+
+    u = repos.users.create("arrays@example.com")
+    start = dt.date(2025, 1, 1)
+    for i in range(2):
+        repos.records.add(u.id, add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5.5 + i)
+
+    cols = repos.records.daily_means_arrays(u.id, start=start, end=add_days(start, 6))
+    assert list(cols) == ["day", "SCJ", "humeur", "stress", "concentration"]
+    assert cols["day"].dtype == np.dtype("datetime64[D]")
+    assert cols["day"].tolist() == [start, add_days(start, 1)]
+    assert cols["SCJ"].dtype == np.float32
+    assert cols["SCJ"].tolist() == [5.5, 6.5]
+
+    empty = repos.records.daily_means_arrays(u.id, start=add_days(start, 10), end=add_days(start, 20))
+    assert all(len(a) == 0 for a in empty.values())
+
+def test_range_kpis(repos: Repos):
+    u = repos.users.create("kpis@example.com")
+    start = dt.date(2025, 1, 1)
+    assert repos.records.range_kpis(u.id, start=start, end=add_days(start, 6)) == (0, None, None)
+
+    for i in range(3):
+        repos.records.add(u.id, add_days(start, i), humeur=6, sommeil=7, stress=3, concentration=6, scj=5 + i)
+
+    count, avg, best = repos.records.range_kpis(u.id, start=start, end=add_days(start, 1))
+    assert count == 2
+    assert avg == pytest.approx(5.5)
+    assert best == 6.0
+
 def test_get_last_n_records(repos: Repos):
     u = repos.users.create("lastn@example.com")
     start = dt.date(2025, 6, 1)
-    for i in range(10):
-        repos.records.add(u.id, add_days(start, i), humeur=5, sommeil=7, stress=3, concentration=6, scj=float(i))
+    repos.records.add_many(u.id, [
+        dict(date=add_days(start, i), humeur=5, sommeil=7, stress=3, concentration=6, scj=float(i))
+        for i in range(10)
+    ])
 
     last7 = repos.records.last_n(u.id, n=7)
     # Renvoie en ordre chronologique croissant
@@ -214,8 +511,10 @@ def test_get_weekly_average(repos: Repos):
     u = repos.users.create("avg7@example.com")
     end = dt.date(2025, 7, 7)
     # 7 jours consécutifs : SCJ = 1..7 -> moyenne = 4.0
-    for i in range(7):
-        repos.records.add(u.id, add_days(end, -6 + i), humeur=6, sommeil=7, stress=3, concentration=6, scj=float(i + 1))
+    repos.records.add_many(u.id, [
+        dict(date=add_days(end, -6 + i), humeur=6, sommeil=7, stress=3, concentration=6, scj=float(i + 1))
+        for i in range(7)
+    ])
 
     avg = repos.records.weekly_avg(u.id, end_date=end)
     assert avg == pytest.approx(4.0, abs=1e-9)
@@ -224,9 +523,72 @@ def test_get_weekly_average_with_missing_days(repos: Repos):
     u = repos.users.create("avg_sparse@example.com")
     end = dt.date(2025, 8, 8)
     # Seulement 3 jours sur la fenêtre : moyenne doit être celle des présents
-    repos.records.add(u.id, add_days(end, -6), humeur=6, sommeil=7, stress=3, concentration=6, scj=5.0)
-    repos.records.add(u.id, add_days(end, -3), humeur=6, sommeil=7, stress=3, concentration=6, scj=7.0)
-    repos.records.add(u.id, add_days(end, -0), humeur=6, sommeil=7, stress=3, concentration=6, scj=9.0)
+    repos.records.add_many(u.id, [
+        dict(date=add_days(end, -offset), humeur=6, sommeil=7, stress=3, concentration=6, scj=scj)
+        for offset, scj in ((6, 5.0), (3, 7.0), (0, 9.0))
+    ])
 
     avg = repos.records.weekly_avg(u.id, end_date=end)
     assert avg == pytest.approx((5.0 + 7.0 + 9.0) / 3.0, abs=1e-9)
+
+def test_weekly_average_is_a_single_sql_aggregate(repos: Repos):
+    from sqlalchemy import event
+
+    u = repos.users.create("avg_sql@example.com")
+    end = dt.date(2025, 9, 9)
+    repos.records.add_many(u.id, [
+        dict(date=add_days(end, -i), humeur=6, sommeil=7, stress=3, concentration=6, scj=float(i))
+        for i in range(10)
+    ])
+
+    statements = []
+    listener = _statement_recorder(statements)
+    event.listen(repos.engine, "before_cursor_execute", listener)
+    try:
+        assert repos.records.weekly_avg(u.id, end_date=end) == pytest.approx(3.0)  # jours 0..6 seulement
+    finally:
+        event.remove(repos.engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert "avg(records.scj)" in statements[0]
+
+@pytest.mark.parametrize("sql", [
+    # get_range (ASC et DESC) et weekly_avg : plage de dates d'un utilisateur
+    "SELECT * FROM records WHERE user_id = 1 AND date BETWEEN '2025-01-01' AND '2025-01-07' ORDER BY date",
+    "SELECT * FROM records WHERE user_id = 1 AND date >= '2025-01-01' ORDER BY date DESC",
+    "SELECT avg(scj) FROM records WHERE user_id = 1 AND date BETWEEN '2025-01-01' AND '2025-01-07'",
+])
+def test_date_range_queries_use_composite_index(repos: Repos, sql):
+    from sqlalchemy import text
+
+    conn = repos.connection
+    plan = " ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    indexes = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "USING INDEX ix_records_user_date_desc" in plan
+    assert "TEMP B-TREE" not in plan
+    assert "ix_records_user_id" not in indexes  # redondant avec le préfixe de l'index composite
+
+def test_weekly_average_python_fallback_matches_sql(repos: Repos, monkeypatch):
+    u = repos.users.create("avg_fallback@example.com")
+    end = dt.date(2025, 9, 9)
+    repos.records.add_many(u.id, [
+        dict(date=add_days(end, -offset), humeur=6, sommeil=7, stress=3, concentration=6, scj=scj)
+        for offset, scj in ((0, 5.5), (2, 7.25), (6, 3.0), (7, 9.0))
+    ])
+    sql_avg = repos.records.weekly_avg(u.id, end_date=end)
+
+    # Moteur non-SQLite simulé : chemin array('d') + statistics.fmean
+    monkeypatch.setattr(repos.engine.dialect, "name", "postgresql")
+    assert repos.records.weekly_avg(u.id, end_date=end) == pytest.approx(sql_avg)
+    assert repos.records.weekly_avg(u.id, end_date=add_days(end, 30)) is None
+
+def test_last_n_query_uses_composite_index(repos: Repos):
+    """Le tri DESC de last_n doit être servi par l'index (user_id, date DESC), sans B-tree temporaire."""
+    from sqlalchemy import text
+
+    plan = " ".join(
+        row[-1] for row in repos.connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM records WHERE user_id = 1 ORDER BY date DESC LIMIT 7"
+        ))
+    )
+    assert "ix_records_user_date_desc" in plan
+    assert "TEMP B-TREE" not in plan
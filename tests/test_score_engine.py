@@ -14,12 +14,17 @@ Ce fichier couvre :
 """
 
 import math
+
+import numpy as np
 import pytest
 
 from app.services.score_engine import (
     DailyInput,
     compute_scj,
+    compute_scj_batch,
+    compute_scj_many,
     interpret_scj,
+    interpret_scj_batch,
     InputValidationError,
     DEFAULT_WEIGHTS,
     MAX_SLEEP_HOURS,
@@ -53,7 +58,7 @@ def test_validate_input_ok(humeur, sommeil, stress, concentration):
     - sommeil ∈ [0..MAX_SLEEP_HOURS] (cap "raisonnable")
     """
     d = DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
-    # compute_scj appelle validate_input en interne : ne doit pas lever
+    # la construction valide les bornes : ne doit pas lever
     _ = compute_scj(d)
 
 
@@ -72,11 +77,12 @@ def test_validate_input_ok(humeur, sommeil, stress, concentration):
 )
 def test_validate_input_raises_with_field_name(humeur, sommeil, stress, concentration, field_name):
     """
-    Hors bornes => doit lever InputValidationError avec le nom du champ fautif dans le message.
+    Hors bornes => doit lever InputValidationError dès la construction du DailyInput,
+    avec le nom du champ fautif en attribut (et dans le message).
     """
-    d = DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
     with pytest.raises(InputValidationError) as exc:
-        compute_scj(d)
+        DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
+    assert exc.value.field == field_name
     assert field_name in str(exc.value)
 
 
@@ -151,6 +157,164 @@ def test_idempotence_same_input_same_output():
     assert r1.weights == r2.weights == DEFAULT_WEIGHTS
 
 
+@pytest.mark.parametrize(
+    "humeur,sommeil,stress,concentration",
+    [(6.5, 7.0, 4.0, 6.8), (0, 0, 10, 0), (10, 14, 0, 10), (3.3, 5.1, 7.7, 2.9)],
+)
+def test_default_fast_path_matches_generic_path(humeur, sommeil, stress, concentration):
+    """
+    Le chemin rapide (poids par défaut) doit donner exactement le même résultat
+    que le calcul générique avec une copie des poids par défaut.
+    """
+    d = DailyInput(humeur=humeur, sommeil=sommeil, stress=stress, concentration=concentration)
+    fast = compute_scj(d)
+    generic = compute_scj(d, weights=dict(DEFAULT_WEIGHTS))
+    assert fast.raw == generic.raw
+    assert fast.scj == generic.scj
+    assert fast.weights == generic.weights
+
+
+def test_compute_scj_batch_matches_scalar():
+    """
+    La version vectorisée renvoie, ligne à ligne, le même SCJ que compute_scj.
+    """
+    rows = [(6.5, 7.0, 4.0, 6.8), (0, 0, 10, 0), (10, 14, 0, 10), (3.3, 5.1, 7.7, 2.9), (7, 6.5, 3, 7.5)]
+    h, s, st, c = zip(*rows)
+    batch = compute_scj_batch(h, s, st, c)
+    assert batch.tolist() == [compute_scj(DailyInput(*r)).scj for r in rows]
+
+    w = {"sommeil": 1.0, "humeur": 0.0, "concentration": 0.0, "stress": 0.0}
+    assert compute_scj_batch([0], [12.0], [0], [0], weights=w, clamp_output=False).tolist() == [12.0]
+
+
+def test_compute_scj_default_path_is_cached():
+    """
+    Poids par défaut : deux DailyInput égaux partagent le même ScoreResult (mémoïsé).
+    """
+    a = compute_scj(DailyInput(humeur=6.1, sommeil=7.2, stress=3.3, concentration=5.4))
+    b = compute_scj(DailyInput(humeur=6.1, sommeil=7.2, stress=3.3, concentration=5.4))
+    assert a is b
+    assert compute_scj(DailyInput(6.1, 7.2, 3.3, 5.4), rounding=3) is not a
+
+
+def test_custom_weights_denominator_is_memoized():
+    """
+    Même jeu de poids (même contenu, objets différents) => dénominateur calculé une seule fois.
+    """
+    from app.services import score_engine
+
+    score_engine._denom_for.cache_clear()
+    d = DailyInput(humeur=6, sommeil=7, stress=4, concentration=5)
+    r1 = compute_scj(d, weights={"concentration": 1.5, "humeur": 0.5, "sommeil": 1.0, "stress": -0.5})
+    r2 = compute_scj(d, weights={"concentration": 1.5, "humeur": 0.5, "sommeil": 1.0, "stress": -0.5})
+    assert r1 == r2
+    info = score_engine._denom_for.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+@pytest.mark.parametrize(
+    "weights",
+    [None, {"concentration": 1.5, "humeur": 0.5, "sommeil": 1.0, "stress": -0.5}],
+)
+def test_compute_scj_many_matches_scalar(weights):
+    """
+    Chemin matriciel (N, 4) : mêmes scores que compute_scj ligne à ligne (à la précision float32).
+    """
+    rows = [(0, 0, 10, 0), (10, 14, 0, 10), (6.5, 7.2, 3.1, 5.8), (7, 6, 2, 7), (3.3, 4.4, 9.9, 1.1)]
+    many = compute_scj_many(rows, weights=weights)
+    assert many.dtype == np.float32 and many.shape == (len(rows),)
+    expected = [compute_scj(DailyInput(*r), weights=weights).scj for r in rows]
+    assert many.tolist() == pytest.approx(expected, abs=1e-6)
+
+
+def test_compute_scj_many_accepts_daily_inputs():
+    """
+    Une séquence de DailyInput donne le même résultat que la matrice.
+    """
+    import dataclasses
+
+    rows = [(6.5, 7.2, 3.1, 5.8), (7, 6, 2, 7)]
+    days = [DailyInput(*r) for r in rows]
+    assert compute_scj_many(days).tolist() == compute_scj_many(rows).tolist()
+    assert not hasattr(days[0], "__dict__")  # slots
+    assert dataclasses.asdict(days[0]) == dict(zip(("humeur", "sommeil", "stress", "concentration"), rows[0]))
+
+
+def test_compute_scj_many_numba_opt_in_matches_numpy():
+    """
+    use_numba=True : mêmes SCJ que le chemin NumPy (noyau Numba, ou repli NumPy sans numba).
+    """
+    rng = np.random.default_rng(0)
+    x = np.column_stack([
+        rng.uniform(0, 10, 12_000).round(1),
+        rng.uniform(0, 14, 12_000).round(1),
+        rng.uniform(0, 10, 12_000).round(1),
+        rng.uniform(0, 10, 12_000).round(1),
+    ])
+    assert np.array_equal(compute_scj_many(x, use_numba=True), compute_scj_many(x))
+    with pytest.raises(InputValidationError):
+        compute_scj_many(np.vstack([x, [(11, 7, 3, 6)]]), use_numba=True)  # validé avant le noyau
+
+
+def test_numba_kernel_matches_numpy_path():
+    pytest.importorskip("numba")
+    from app.services.score_engine_numba import get_kernel
+    from app.services import score_engine
+
+    x = np.array([(6.5, 7.2, 3.1, 5.8), (0, 0, 10, 0), (10, 14, 0, 10)], dtype=np.float64)
+    out = get_kernel()(x, score_engine._DEFAULT_W_VEC, score_engine._DEFAULT_DENOM, 0.0, 10.0, True, 2)
+    assert out.tolist() == pytest.approx([compute_scj(DailyInput(*r)).scj for r in x.tolist()], abs=1e-9)
+
+
+def test_compute_scj_accepts_unhashable_duck_typed_inputs():
+    """
+    Objets "DailyInput-like" (mutables, non hashables) : pas de cache, même résultat.
+    """
+    from types import SimpleNamespace
+
+    d = SimpleNamespace(humeur=6.5, sommeil=7.0, stress=4.0, concentration=6.8)
+    assert compute_scj(d) == compute_scj(DailyInput(6.5, 7.0, 4.0, 6.8))
+    d.humeur = 8.0  # un objet mutable n'est jamais servi depuis un cache périmé
+    assert compute_scj(d).scj == compute_scj(DailyInput(8.0, 7.0, 4.0, 6.8)).scj
+
+
+def test_compute_scj_validates_duck_typed_inputs():
+    from types import SimpleNamespace
+
+    with pytest.raises(InputValidationError) as exc:
+        compute_scj(SimpleNamespace(humeur=6.5, sommeil=20.0, stress=4.0, concentration=6.8))
+    assert exc.value.field == "sommeil"
+
+
+def test_compute_scj_many_validates_shape_and_bounds():
+    with pytest.raises(ValueError):
+        compute_scj_many([[5, 7, 3]])
+    with pytest.raises(InputValidationError) as exc:
+        compute_scj_many([[5, 7, 3, 6], [5, 15, 3, 6], [-1, 16, 3, 6]])
+    assert exc.value.field == "humeur"
+    assert exc.value.fields == ("humeur", "sommeil")
+    assert exc.value.value.tolist() == [-1.0]
+
+
+def test_compute_scj_batch_validates_all_rows():
+    with pytest.raises(InputValidationError) as exc:
+        compute_scj_batch([5, 5], [7, 7], [3, 11], [6, 6])
+    assert exc.value.field == "stress"
+    assert "stress" in str(exc.value)
+
+
+def test_compute_scj_many_is_batch_cast_to_float32():
+    rows = np.array([(6.5, 7.2, 3.1, 5.8), (7, 6, 2, 7), (0, 14, 10, 0)])
+    expected = compute_scj_batch(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]).astype(np.float32)
+    assert np.array_equal(compute_scj_many(rows), expected)
+    # validation partagée : même erreur structurée des deux côtés
+    bad = np.array([(-1, 16, 3, 6)], dtype=float)
+    for call in (lambda: compute_scj_many(bad), lambda: compute_scj_batch(*bad.T)):
+        with pytest.raises(InputValidationError) as exc:
+            call()
+        assert (exc.value.field, exc.value.fields) == ("humeur", ("humeur", "sommeil"))
+
+
 # -----------------------------------------------------------------------------
 # Personnalisation des poids, dénominateur, arrondi et clampage
 # -----------------------------------------------------------------------------
@@ -194,6 +358,16 @@ def test_no_clamp_allows_values_above_10_if_weights_allow():
     assert res_unclamped.scj == 12.0  # pas de clamp => > 10 autorisé
 
 
+@pytest.mark.parametrize(
+    "raw,expected",
+    [(-0.004, 0.0), (0.0, 0.0), (4.6249, 4.62), (9.996, 10.0), (10.0001, 10.0), (12.5, 10.0)],
+)
+def test_clamp_round_matches_min_max_round(raw, expected):
+    from app.services.score_engine import _clamp_round
+
+    assert _clamp_round(raw, 0.0, 10.0, 2) == expected == round(min(max(raw, 0.0), 10.0), 2)
+
+
 def test_rounding_parameter_changes_display_not_raw():
     """
     'rounding' n'affecte que la valeur présentée (scj), pas la valeur brute (raw).
@@ -240,6 +414,15 @@ def test_interpret_scj_clamps_input():
     assert "Énergie mentale très élevée" in interpret_scj(25.0)  # clamp -> haut
 
 
+def test_interpret_scj_batch_matches_scalar():
+    """
+    interpret_scj_batch() renvoie exactement les messages de interpret_scj(), bornes de tranches incluses.
+    """
+    scores = [0.0, 3.99, 4.0, 5.49, 5.5, 6.99, 7.0, 8.49, 8.5, 10.0]
+    assert list(interpret_scj_batch(scores)) == [interpret_scj(s) for s in scores]
+    assert interpret_scj(-0.0) == interpret_scj(0.0) and interpret_scj(10.5) == interpret_scj(10.0)
+
+
 # -----------------------------------------------------------------------------
 # Tests de non-régression simples
 # -----------------------------------------------------------------------------
@@ -252,7 +435,9 @@ def test_regression_guard_default_example():
     # Valeurs issues du calcul manuel
     res = compute_scj(d)
     expected_raw = ((2*6.8) + 6.5 + 7.0 - 4.0) / 5.0  # = 4.62
-    assert abs(res.raw - expected_raw) < 1e-9
+    assert abs(res.raw - expected_raw) < 1e-12
+    # chemin rapide déroulé == chemin générique, au bit près
+    assert res.raw == compute_scj(d, weights=dict(DEFAULT_WEIGHTS)).raw
     assert res.scj == round(min(max(expected_raw, 0.0), 10.0), 2)
 
 # -----------------------------------------------------------------------------